@@ -1,35 +1,78 @@
 # The main program
 # This uses the generated "app_gui.py" file from pyuic6 and then hooked with commands from different scripts.
 # TODO: Figure out how to update the repository
-from PyQt6 import QtWidgets
-from PyQt6.QtWidgets import QMessageBox
-from pyjoystick.sdl2 import Joystick, run_event_loop
-from generated_scripts.app_gui import Ui_MainWindow
-
+# Importing it has no side effects, everything is started by init_main_app().
+# Run as a script, the engine is started before Qt and the window are imported (see the block after start_input()),
+# so controller input works while they load.
+import startup  # first, so the import time is measured too
+import config_snapshot
+import cursor
 import db_setup as setup
+import engine_process
+import logger
 import mapping as mapping
-import pyjoystick
+import shards
 import sys
-import tkeyboard
 
-db_cmds = setup.DBcmds()
-table_cmds = setup.TABLEcmds()
+# Log records are written to a file by a background thread, see logger.py.
+LOG_PATH = f"{setup.db_path}/controller.log"
+log = logger.get_logger("app")
+
+# Both go through the config cache, reads come from memory and writes go through to the database.
+db_cmds = setup.config
+table_cmds = setup.config
+
+# Set by start_engine()
+controls_dict = None
+action_generator = None
+
+
+def start_engine():
+    # Prepares the generator for receiving controller input/output and for generating its own events.
+    # Every connected controller gets its own engine.
+    # With --engine-process the engine runs in a process of its own, so the GUI can't slow it down.
+    global controls_dict, action_generator
+    # Starts with the config that was in use last time (see config_snapshot.py), so input works without
+    # waiting for the database or the window. An engine process does the same on its own.
+    snapshot = config_snapshot.load()
+    if snapshot is not None:
+        controls_dict = dict(zip(snapshot["controls"], mapping.definitions))
+    else:
+        # Prepares the controls for keybind pairing.
+        controls_dict = mapping.Controls().get()
+
+    if "--engine-process" in sys.argv:
+        action_generator = engine_process.EngineClient(controls_dict)
+    elif snapshot is not None:
+        action_generator = shards.ShardedEngine(None, controls_dict, tuning_values=snapshot["tuning"])
+        engine_process.apply_config(action_generator, snapshot)
+    else:
+        action_generator = shards.ShardedEngine(None, controls_dict)
+    action_generator.start()
+
+
+def start_input(profiler):
+    # Starts the log writer and the engine, the first two phases of startup.
+    profiler.mark("imports")
+    logger.start_writer(LOG_PATH)
+    start_engine()
+    profiler.mark("engine")
+
 
-# Prepares the controls for keybind pairing.
-controls = mapping.Controls()
-controls_dict = controls.get()
+if __name__ == "__main__":
+    startup_profiler = startup.StartupProfiler()
+    start_input(startup_profiler)
 
-# Prepares this generator for receiving controller input/output and for generating its own events.
-action_generator = mapping.ActionGenerator(None, controls_dict)
-action_generator.start()
+# Only imported now, so that running the app doesn't wait for them to start handling input.
+from PyQt6 import QtCore, QtWidgets
+from PyQt6.QtWidgets import QMessageBox
+from generated_scripts.app_gui import Ui_MainWindow
+import tkeyboard
 
 
 def get_preset_num(preset):
-    # Helper function, splits preset string into two,
-    # Then finds the number of the preset.
-    preset_info = preset.split("_")
-    preset_num = preset_info[1]
-    return preset_num
+    # Helper function, finds the id of a preset from its name.
+    return table_cmds.get_preset_id(preset)
 
 
 def create_warning_dialog(text, cmd):
@@ -44,6 +87,11 @@ def create_warning_dialog(text, cmd):
         cmd()
 
 
+class DeviceSignals(QtCore.QObject):
+    # Carries controller changes from the engine's thread over to the GUI thread.
+    changed = QtCore.pyqtSignal()
+
+
 class App(QtWidgets.QMainWindow):
     def __init__(self):
         super(App, self).__init__()
@@ -53,19 +101,27 @@ class App(QtWidgets.QMainWindow):
         self.ui.setupUi(self)
         self.show()
 
+        # The controllers list updates itself whenever a controller is plugged in or out.
+        self.device_signals = DeviceSignals()
+        self.device_signals.changed.connect(self.list_joysticks)
+        action_generator.devices.subscribe(lambda change, device: self.device_signals.changed.emit())
+
         try:
             # Gets keybind_data to bind them to the controls, however if no presets are enabled,
             # the program immediately sets PRESET_1 to True to prevent program crash.
             keybind_data = self.get_keybind_data()
         except TypeError:
-            db_cmds.update_data(
-                table="presets", column="PRESET_1", data=True, row=1)
+            table_cmds.activate_preset(table_cmds.get_preset_names()[0])
             keybind_data = self.get_keybind_data()
 
         self.bind_keybinds_to_controls()
         self.enable_controls()
         self.list_joysticks()
         self.set_saved_tuning()
+        # The engine may have started with the tuning of the config snapshot, from now on it uses the saved one.
+        action_generator.get_tuning_data()
+        action_generator.update_event_repeater()
+        action_generator.update_cursor()
         self.populate_mapping_list(
             keybinds=keybind_data[0], preset=keybind_data[1])
         self.set_preset_choices()
@@ -164,47 +220,49 @@ class App(QtWidgets.QMainWindow):
     def enable_controls(self):
         keybinds_dict = self.bind_keybinds_to_controls()
         self.enable = True
+        action_generator.update_macros()
+        # The chords and combos of the preset are set first, so they're compiled together with its keybinds.
+        preset_num = get_preset_num(self.controls_data[1])
+        action_generator.set_chords(mapping.Chords().get(preset_num))
         # action_generator uses the keybinds within keybinds_dict to create events.
         action_generator.keybinds = keybinds_dict
+        action_generator.enable()
 
     def disable_controls(self):
         self.enable = False
-        # Keybinds are set to None to prevent returning movement.
-        action_generator.keybinds = None
+        # The engine ignores every key until it's enabled again, the preset stays compiled.
+        action_generator.disable()
 
     def list_joysticks(self):
+        # The engine keeps track of the connected controllers as they're plugged in and out,
+        # so this only has to read its list.
         self.ui.controllers_list.clear()
-
-        def add_joysticks(joysticks):
-            try:
-                # Checks for the length of the joystick list.
-                # If none, returns a text saying 'No controls found'
-                if len(joysticks) <= 0:
-                    text = "No controls found. Connect through USB?"
-                    self.ui.controllers_list.addItem(text)
-                # Else, it iterates through the list and displays them
-                else:
-                    for joystick in joysticks:
-                        controller = joystick.name
-                        self.ui.controllers_list.addItem(controller)
-            except TypeError:
-                # Sometimes a TypeError pops up, and you can't iterate through the supposed "list" of joysticks.
-                # Therefore if the data is non-iterable, we don't have to bother counting through the list.
-                controller = joysticks.name
-                self.ui.controllers_list.addItem(controller)
-
-        # This finds the controllers themselves, then stops after finding them.
-        mngr = pyjoystick.ThreadEventManager(
-            event_loop=run_event_loop, add_joystick=add_joysticks)
-        mngr.start()
-        mngr.add_joystick(Joystick.get_joysticks())
-        mngr.stop()
+        joysticks = action_generator.devices.get_devices()
+
+        # Checks for the length of the joystick list.
+        # If none, returns a text saying 'No controls found'
+        if len(joysticks) <= 0:
+            text = "No controls found. Connect through USB?"
+            self.ui.controllers_list.addItem(text)
+        # Else, it iterates through the list and displays them
+        else:
+            for joystick in joysticks:
+                self.ui.controllers_list.addItem(joystick.name)
 
     def set_saved_tuning(self):
         """Sets saved tuning data based from "tuning" table."""
         tuning_data = db_cmds.get_all_data("tuning")
         tuning_values = list(tuning_data[0])
 
+        # Sets the cursor mode and rate, the lists are in the same order as CURSOR_MODES and CURSOR_RATES
+        cursor_mode, cursor_rate = tuning_values[5], tuning_values[6]
+        if cursor_mode not in setup.TABLEcmds.CURSOR_MODES:
+            cursor_mode = setup.TABLEcmds.DEFAULT_CURSOR_MODE
+        if cursor_rate not in cursor.CURSOR_RATES:
+            cursor_rate = setup.TABLEcmds.DEFAULT_CURSOR_RATE
+        self.ui.cursor_mode_list.setCurrentIndex(setup.TABLEcmds.CURSOR_MODES.index(cursor_mode))
+        self.ui.cursor_rate_list.setCurrentIndex(cursor.CURSOR_RATES.index(cursor_rate))
+
         # Toggles repeat_chkbox
         repeat = tuning_values[2]
         if repeat:
@@ -287,6 +345,7 @@ class App(QtWidgets.QMainWindow):
         # Resets the tuning of the program and replaces it with the default settings.
         def action():
             table_cmds.reset_tuning()
+            action_generator.get_tuning_data()
             self.set_saved_tuning()
             self.save_tuning()
 
@@ -303,23 +362,26 @@ class App(QtWidgets.QMainWindow):
         enable_repeat = self.ui.repeat_chkbox.isChecked()
         delay_activation = self.ui.delay_activation_input.value()
         repeat_speed = self.ui.repeat_speed_input.value()
+        cursor_mode = setup.TABLEcmds.CURSOR_MODES[self.ui.cursor_mode_list.currentIndex()]
+        cursor_rate = cursor.CURSOR_RATES[self.ui.cursor_rate_list.currentIndex()]
 
         # Saves to db
         table_cmds.save_tuning(
-            cursor_speed, scroll_speed, enable_repeat, delay_activation, repeat_speed)
+            cursor_speed, scroll_speed, enable_repeat, delay_activation, repeat_speed,
+            cursor_mode, cursor_rate)
 
-        # updates the tuning and repeater
+        # updates the tuning, repeater and cursor
         action_generator.get_tuning_data()
         action_generator.update_event_repeater()
-        action_generator.toggle_event_repeater(action_generator.repeater)
+        action_generator.update_cursor()
 
     def populate_mapping_list(self, keybinds, preset):
         # Populates 'mapping_list' with data, the list visualizes the current binds
         # that are connected to specific controls.
 
         # Gets column names of presets and mapping tables
-        self.preset_columns = db_cmds.get_column("presets")
-        self.control_rows = db_cmds.get_column("mapping")
+        self.preset_columns = db_cmds.get_preset_names()
+        self.control_rows = db_cmds.get_controls()
 
         def set_cells():
             # Sets the amount of columns
@@ -352,7 +414,7 @@ class App(QtWidgets.QMainWindow):
         self.ui.mapping_list.resizeColumnsToContents()
 
     def set_preset_choices(self):
-        presets = db_cmds.get_column("presets")
+        presets = db_cmds.get_preset_names()
         for row, preset in enumerate(presets):
             self.ui.preset_to_use_list.insertItem(row, preset)
 
@@ -371,59 +433,18 @@ class App(QtWidgets.QMainWindow):
             self.ui.reset_first_preset_btn.setDisabled(False)
         
     def reset_first_preset(self):
-        # I combined some code from 2 different functions in db_setup.py.
-        # Essentialy, it just loads the default configurations from preset 1 as if the database was freshly made.
+        # Loads the default configurations from preset 1 as if the database was freshly made.
         # Then refreshes the mapping list
-        default_mapping = [
-            "'keyboard_pg_up'",
-            "'keyboard_pg_down'",
-            "'keyboard_pg_left'",
-            "'keyboard_pg_right'",
-            "'summon_keyboard'",
-            "'mouse_right_click'",
-            "'mouse_left_click'",
-            "'mouse_left_press'",
-            "'keyboard_ctrl_c'",
-            "'keyboard_alt_tab'",
-            "'keyboard_ctrl_a'",
-            "'mouse_move_up'",
-            "'mouse_move_down'",
-            "'mouse_move_left'",
-            "'mouse_move_right'",
-            "'keyboard_ctrl_v'",
-            "'keyboard_tab'",
-            "'keyboard_ctrl_x'",
-            "'mouse_scroll_up'",
-            "'mouse_scroll_down'",
-            "'Empty'",
-            "'Empty'",
-            "'keyboard_windows_btn'",
-            "'Empty'",
-            "'Empty'"
-        ]
-
-        # Damn it. I forgot the methods are from a different class!
-        table = "mapping"
-        columns = table_cmds.get_column("mapping")
-        
-        row = 1
-        for column, keybind in zip(columns, default_mapping):
-            print(table, column, keybind, row)
-            table_cmds.update_data(table, column, keybind, row)
+        table_cmds.set_mapping(get_preset_num("PRESET_1"), setup.TABLEcmds.DEFAULT_MAPPING)
 
         self.refresh_mapping_list()
 
     def use_selected_preset(self):
         # Gets selected preset
         selected_preset = self.ui.preset_to_use_list.currentText()
-        all_presets = db_cmds.get_column("presets")
 
-        # Updates the selected preset to 'True', so that it can be used
-        db_cmds.update_data("presets", selected_preset, data=True, row=1)
-        for other_preset in all_presets:
-            if other_preset != selected_preset:
-                db_cmds.update_data(
-                    "presets", other_preset, data=False, row=1)
+        # Updates the selected preset to 'True' and the others to 'False', so that it can be used
+        table_cmds.activate_preset(selected_preset)
 
         self.ui.in_use_lbl.setText(f"In-Use: {selected_preset}")
 
@@ -433,7 +454,7 @@ class App(QtWidgets.QMainWindow):
     def set_keybind_editing(self):
         # Populates the edit_control_list, and edit_keybind_list with table columns
         # for keybind_editing
-        controls = db_cmds.get_column("mapping")
+        controls = db_cmds.get_controls()
         keybinds = db_cmds.get_column("all_keybinds")
         for row, control in enumerate(controls):
             self.ui.edit_control_list.insertItem(row, control)
@@ -442,15 +463,12 @@ class App(QtWidgets.QMainWindow):
 
     def sync_keybind_to_control(self):
         control = self.ui.edit_control_list.currentText()
-        raw_keybind = self.ui.edit_keybind_list.currentText()
+        keybind = self.ui.edit_keybind_list.currentText()
         preset = self.ui.preset_to_use_list.currentText()
 
-        # Data has to be quoted for some reason
-        keybind = f"'{raw_keybind}'"
-        # Splits the preset string, takes the number of the preset, then updates a row of data with the number
+        # Finds the id of the preset, then updates its binding of the control
         preset_num = get_preset_num(preset)
-        db_cmds.update_data(
-            table="mapping", column=control, data=keybind, row=preset_num)
+        db_cmds.set_binding(preset_num, control, keybind)
         self.update_keybind_data()
 
     def clear_keybind(self):
@@ -458,11 +476,10 @@ class App(QtWidgets.QMainWindow):
         # so that the control is unusable until a new keybind is synced to it.
         preset = self.ui.preset_to_use_list.currentText()
         control = self.ui.edit_control_list.currentText()
-        new_data = "'Empty'"
+        new_data = "Empty"
 
         preset_num = get_preset_num(preset)
-        db_cmds.update_data(
-            table="mapping", column=control, data=new_data, row=preset_num)
+        db_cmds.set_binding(preset_num, control, new_data)
         self.update_keybind_data()
 
     def clear_all_keybinds(self):
@@ -497,7 +514,7 @@ class App(QtWidgets.QMainWindow):
         # but it doesn't set the keybinds to that preset immediately unless it is then used.
         preset = self.ui.preset_to_use_list.currentText()
         preset_num = get_preset_num(preset)
-        preview_data = db_cmds.get_row_data(table="mapping", row=preset_num)
+        preview_data = db_cmds.get_mapping(preset_num)
 
         self.ui.previewing_lbl.setText(f"Previewing: {preset}")
         self.populate_mapping_list(preview_data, preset)
@@ -530,7 +547,7 @@ class App(QtWidgets.QMainWindow):
                 self.ui.edit_keybind_list.setCurrentText(current_cell.text())
 
         except AttributeError:
-            print("No cells selected")
+            log.debug("no_cell_selected")
 
     def highlight_mapping_list_cell(self):
         # Gets the amt of rows and columns of the mapping list, then gets every data in it
@@ -554,12 +571,38 @@ class App(QtWidgets.QMainWindow):
         self.tkeyboard_widget.capture_pressed_keys()
 
 
-def init_main_app():
+def init_main_app(profiler=None):
+    # profiler is the one the engine was started with, if it was started already.
+    if profiler is None:
+        profiler = startup.StartupProfiler()
+        start_input(profiler)
+    else:
+        # Qt and the window's modules, imported after the engine started
+        profiler.mark("qt")
+
+    # The database would be set up the first time it's used anyway, it's done here so it has its own phase.
+    setup.ensure_setup()
+    # The app owns the config, so it keeps the snapshot up to date from now on.
+    db_cmds.snapshot_path = config_snapshot.SNAPSHOT_PATH
+    db_cmds.write_snapshot()
+    # The window's changes are saved in the background from now on, see config_writer.py.
+    db_cmds.start_writer()
+    profiler.mark("database")
+
     main_app = QtWidgets.QApplication(sys.argv)
     # declaring as variable prevents memory dumping the entire program.
     _ = App()
-    sys.exit(main_app.exec())
+    profiler.mark("window")
+    profiler.report(print_report="--profile-startup" in sys.argv)
+    exit_code = main_app.exec()
+    try:
+        db_cmds.stop_writer()
+    finally:
+        action_generator.stop()
+        setup.connections.close_all()
+        logger.stop_writer()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
-    init_main_app()
+    init_main_app(startup_profiler)
@@ -0,0 +1,271 @@
+# Cleans up the analog sticks before they're used: smoothing, deadzones with hysteresis and response curves.
+# Cheap controllers have noisy sticks, a stick that's let go doesn't always come back to 0 and one that's held
+# still wobbles a little, which makes the cursor drift and the D-pad-like axis keys flicker on and off.
+#
+# Every axis change the engine sees is pushed into a preallocated buffer, and on every tick of the analog
+# cursor the samples since the last tick are processed together as one block with NumPy,
+# so the cost per tick stays about the same however fast the controller sends its samples.
+
+import math
+import threading
+import time
+from pyjoystick.interface import Key
+
+import numpy as np
+
+# Axes that are filtered, the rest are passed through as they are.
+MAX_AXES = 8
+# (x axis, y axis) of the left and right stick, used by radial deadzones.
+STICKS = ((0, 1), (2, 4))
+# Most samples kept between two ticks, any more replace the newest one.
+BLOCK_SIZE = 512
+# Value an axis has to pass to count as a pressed "Axis N" key, the same as pyjoystick.
+KEY_THRESHOLD = 0.5
+
+SMOOTHING_TYPES = ("none", "lowpass", "one_euro")
+
+
+class AxisSettings:
+    # deadzone: values closer to the center than this become 0, the rest is stretched back out to 0..1
+    # radial: the deadzone is measured on the whole stick (both axes together) so diagonals aren't cut off,
+    #         axes that aren't part of a stick in STICKS always use their own value
+    # hysteresis: a centered stick has to go this much past the deadzone to start moving, and stops at this much
+    #             before it. Axis keys are pressed at KEY_THRESHOLD + hysteresis and released at KEY_THRESHOLD - hysteresis
+    # smoothing: "none", "lowpass" or "one_euro" (a low-pass filter that smooths less the faster the stick moves)
+    # cutoff: in Hz, the cutoff of the low-pass filter, or of the One-Euro filter when the stick is still
+    # beta: how much the One-Euro cutoff goes up with the speed of the stick, higher means less lag on fast moves
+    # curve: exponent of the response curve, above 1 gives finer control near the center
+
+    def __init__(self, deadzone=0.1, radial=True, hysteresis=0.03, smoothing="one_euro", cutoff=2.0, beta=5.0,
+                 curve=1.0):
+        if smoothing not in SMOOTHING_TYPES:
+            raise ValueError(f"Smoothing must be one of {SMOOTHING_TYPES}, got {smoothing}")
+        if not 0 <= deadzone < 1:
+            raise ValueError(f"Deadzone must be from 0 up to 1, got {deadzone}")
+        if cutoff <= 0:
+            raise ValueError(f"Cutoff must be above 0, got {cutoff}")
+        self.deadzone = deadzone
+        self.radial = radial
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+        self.cutoff = cutoff
+        self.beta = beta
+        self.curve = curve
+
+
+class AxisFilter:
+    # push() is called from the input thread and process() from the cursor's thread.
+    # read_raw takes an axis number and returns its current value, it's used on ticks where nothing was pushed
+    # (e.g. when the engine reads pyjoystick's manager directly and never sees the axis changes).
+
+    # Cutoff of the One-Euro filter's speed estimate, in Hz.
+    SPEED_CUTOFF = 1.0
+
+    def __init__(self, read_raw=None, settings=None):
+        self.read_raw = read_raw
+        self.lock = threading.Lock()
+
+        # Samples pushed since the last tick
+        self.sample_times = np.zeros(BLOCK_SIZE)
+        self.sample_axes = np.zeros(BLOCK_SIZE, dtype=np.intp)
+        self.sample_values = np.zeros(BLOCK_SIZE)
+        self.sample_count = 0
+
+        # Block of samples, one row per sample with the value of every axis at that time.
+        self.block = np.zeros((BLOCK_SIZE + 1, MAX_AXES))
+        self.block_times = np.zeros(BLOCK_SIZE + 1)
+        self.rows = np.arange(BLOCK_SIZE + 1)
+        # Work buffers of the smoothing
+        self.deltas = np.zeros(BLOCK_SIZE + 1)
+        self.alpha = np.zeros((BLOCK_SIZE + 1, MAX_AXES))
+        self.decay = np.zeros((BLOCK_SIZE + 1, MAX_AXES))
+
+        self.raw = np.zeros(MAX_AXES)  # latest value of every axis
+        self.smoothed = np.zeros(MAX_AXES)
+        self.speed = np.zeros(MAX_AXES)
+        self.output = np.zeros(MAX_AXES)
+        self.active = np.zeros(MAX_AXES, dtype=bool)  # out of the deadzone
+        self.key_sides = np.zeros(MAX_AXES, dtype=np.int8)  # side of every axis key that's pressed, 0 if none
+        self.last_time = None
+
+        self.settings = [AxisSettings() for _ in range(MAX_AXES)]
+        if settings is not None:
+            self.settings = [settings for _ in range(MAX_AXES)]
+        self.compile_settings()
+
+    def set_settings(self, number, settings):
+        # Changes the settings of one axis.
+        with self.lock:
+            self.settings[number] = settings
+            self.compile_settings()
+
+    def compile_settings(self):
+        # Turns the settings of every axis into arrays, so that all axes are filtered at once.
+        settings = self.settings
+        self.deadzone = np.array([axis.deadzone for axis in settings])
+        self.hysteresis = np.array([axis.hysteresis for axis in settings])
+        self.cutoff = np.array([axis.cutoff for axis in settings])
+        self.beta = np.array([axis.beta if axis.smoothing == "one_euro" else 0.0 for axis in settings])
+        self.unsmoothed = np.array([axis.smoothing == "none" for axis in settings])
+        self.curve = np.array([axis.curve for axis in settings])
+
+        # Sticks with a radial deadzone (both axes have to want it), every other axis is axial.
+        sticks = [(x, y) for x, y in STICKS if settings[x].radial and settings[y].radial]
+        self.stick_x = np.array([x for x, _ in sticks], dtype=np.intp)
+        self.stick_y = np.array([y for _, y in sticks], dtype=np.intp)
+
+    def push(self, number, value, timestamp=None):
+        if number >= MAX_AXES:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.lock:
+            index = self.sample_count
+            if index == BLOCK_SIZE:
+                index -= 1
+            else:
+                self.sample_count += 1
+            self.sample_times[index] = timestamp
+            self.sample_axes[index] = number
+            self.sample_values[index] = value
+
+    def filter_key(self, key):
+        # Passes an axis key through the hysteresis of its axis before the engine gets it.
+        # Returns None when the key doesn't change anything (e.g. a held stick wobbling around KEY_THRESHOLD),
+        # otherwise a key with a value of -1, 0 (released) or 1. Keys that aren't axes are returned as they are.
+        if key.keytype != Key.AXIS or key.number >= MAX_AXES:
+            return key
+        number = key.number
+        self.push(number, key.value)
+
+        side = self.key_sides[number]
+        hysteresis = self.hysteresis[number]
+        if side and key.value * side > KEY_THRESHOLD - hysteresis:
+            new_side = side
+        elif abs(key.value) > KEY_THRESHOLD + hysteresis:
+            new_side = 1 if key.value > 0 else -1
+        else:
+            new_side = 0
+
+        if new_side == side:
+            return None
+        self.key_sides[number] = new_side
+        new_key = key.copy()
+        new_key.value = float(new_side)
+        return new_key
+
+    def get(self, number):
+        # Filtered value of an axis as of the last tick.
+        if number >= MAX_AXES:
+            return self.read_raw(number) if self.read_raw is not None else 0.0
+        return self.output[number]
+
+    def process(self, now=None):
+        # Filters the samples pushed since the last tick, the results are read with get().
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            count = self.sample_count
+            self.sample_count = 0
+            block_times = self.block_times
+            block_times[:count] = self.sample_times[:count]
+            axes = self.sample_axes[:count].copy()
+            values = self.sample_values[:count].copy()
+
+        if count == 0 and self.read_raw is not None:
+            for number in range(MAX_AXES):
+                try:
+                    self.raw[number] = self.read_raw(number)
+                except IndexError:
+                    pass
+
+        # Every sample becomes a row that has the latest value of every axis at its time.
+        # The last row is now, so the smoothing keeps moving towards the stick's position even when it's held still.
+        rows = count + 1
+        block = self.block[:rows]
+        block[:] = np.nan
+        block[self.rows[:count], axes] = values
+        block_times[count] = max(now, block_times[count - 1]) if count else now
+        self.fill_forward(block, rows)
+        self.raw[:] = block[-1]
+
+        self.smooth(block, block_times[:rows])
+        self.shape()
+        return self.output
+
+    def fill_forward(self, block, rows):
+        # Replaces every NaN with the value of the row above it, the row above the first one being self.raw.
+        missing = np.isnan(block)
+        index = np.where(missing, -1, self.rows[:rows, None])
+        np.maximum.accumulate(index, axis=0, out=index)
+        filled = block[np.maximum(index, 0), np.arange(MAX_AXES)]
+        block[:] = np.where(index < 0, self.raw, filled)
+
+    def smooth(self, block, block_times):
+        # Runs the One-Euro/low-pass filter over the whole block at once.
+        # The One-Euro cutoff is worked out once per block from how fast the stick moved during it, which leaves
+        # a plain low-pass step per row. Those can be folded together without going through the rows one by one:
+        #   smoothed = smoothed * (product of every row's 1 - alpha) + sum of alpha * value * (1 - alpha of the rows after it)
+        # The products are added up as logarithms so that long blocks don't underflow.
+        if self.last_time is None:
+            self.smoothed[:] = block[0]
+            self.last_time = block_times[0]
+
+        rows = len(block)
+        deltas = self.deltas[:rows]
+        deltas[0] = block_times[0] - self.last_time
+        np.subtract(block_times[1:], block_times[:-1], out=deltas[1:])
+        np.maximum(deltas, 1e-4, out=deltas)
+        duration = max(block_times[-1] - self.last_time, 1e-4)
+        self.last_time = block_times[-1]
+
+        smoothed = self.smoothed
+        speed_alpha = smoothing_factor(self.SPEED_CUTOFF, duration)
+        self.speed += speed_alpha * ((block[-1] - smoothed) / duration - self.speed)
+        tau = 1 / (2 * math.pi * (self.cutoff + self.beta * np.abs(self.speed)))
+
+        alpha = self.alpha[:rows]
+        np.divide(tau, deltas[:, None], out=alpha)
+        alpha += 1
+        np.reciprocal(alpha, out=alpha)
+        decay = self.decay[:rows]
+        np.log1p(-alpha, out=decay)
+        np.cumsum(decay, axis=0, out=decay)
+        total_decay = decay[-1].copy()
+        # decay becomes how much each row has faded by the end of the block
+        np.subtract(total_decay, decay, out=decay)
+        np.exp(decay, out=decay)
+        decay *= alpha
+        decay *= block
+
+        smoothed *= np.exp(total_decay)
+        smoothed += decay.sum(axis=0)
+        smoothed[self.unsmoothed] = block[-1][self.unsmoothed]
+
+    def shape(self):
+        # Applies the deadzones, with hysteresis, and the response curves to the smoothed values.
+        smoothed = self.smoothed
+        deadzone = self.deadzone
+        threshold = np.where(self.active, deadzone - self.hysteresis, deadzone + self.hysteresis)
+
+        # Axial: every axis on its own
+        magnitude = np.abs(smoothed)
+        # Radial: both axes of a stick share the stick's distance from the center
+        if len(self.stick_x):
+            stick_magnitude = np.hypot(smoothed[self.stick_x], smoothed[self.stick_y])
+            magnitude[self.stick_x] = stick_magnitude
+            magnitude[self.stick_y] = stick_magnitude
+
+        self.active = magnitude > threshold
+        # The part of the stick outside the deadzone is stretched to 0..1, then put through the curve.
+        scaled = np.clip((magnitude - deadzone) / (1 - deadzone), 0.0, 1.0) ** self.curve
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(self.active & (magnitude > 0), scaled / magnitude, 0.0)
+        np.multiply(smoothed, scale, out=self.output)
+        np.clip(self.output, -1.0, 1.0, out=self.output)
+
+
+def smoothing_factor(cutoff, delta_time):
+    # Alpha of a low-pass filter with a cutoff (in Hz) sampled every delta_time seconds.
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / delta_time)
@@ -0,0 +1,149 @@
+# Output backends, the part of the engine that actually moves the mouse and presses keys.
+# ActionGenerator only talks to a backend, so the same engine can send input to the OS,
+# do nothing at all (for profiling), or write down what it would have done (for testing).
+
+# Every action can also be written as a tuple of the backend method's name and its arguments,
+# e.g. ("send", "ctrl+c") or ("move_to", 100, 200), so that a list of them can be submitted at once.
+
+import time
+
+
+class OutputBackend:
+    # The methods every backend has. Buttons are the mouse library's names ('left', 'right', 'middle')
+    # and hotkeys are the keyboard library's names ('ctrl+c', 'alt+tab', ...).
+
+    def get_position(self):
+        raise NotImplementedError
+
+    def move_to(self, x, y):
+        raise NotImplementedError
+
+    def click(self, button):
+        raise NotImplementedError
+
+    def press(self, button):
+        raise NotImplementedError
+
+    def wheel(self, delta):
+        raise NotImplementedError
+
+    def send(self, hotkey):
+        # Presses and releases a hotkey.
+        raise NotImplementedError
+
+    def key_down(self, hotkey):
+        raise NotImplementedError
+
+    def key_up(self, hotkey):
+        raise NotImplementedError
+
+    def submit(self, actions):
+        # Runs a batch of action tuples in order.
+        for name, *args in actions:
+            getattr(self, name)(*args)
+
+
+class InputLibBackend(OutputBackend):
+    # Sends input to the OS with the mouse and keyboard libraries.
+    # NOTE: They're imported here rather than at the top so that the other backends still work
+    # on machines where they can't inject input.
+
+    def __init__(self):
+        import mouse
+        import keyboard
+        self.mouse = mouse
+        self.keyboard = keyboard
+
+    def get_position(self):
+        return self.mouse.get_position()
+
+    def move_to(self, x, y):
+        self.mouse.move(x, y)
+
+    def click(self, button):
+        self.mouse.click(button)
+
+    def press(self, button):
+        self.mouse.press(button)
+
+    def wheel(self, delta):
+        self.mouse.wheel(delta)
+
+    def send(self, hotkey):
+        self.keyboard.press_and_release(hotkey)
+
+    def key_down(self, hotkey):
+        self.keyboard.press(hotkey)
+
+    def key_up(self, hotkey):
+        self.keyboard.release(hotkey)
+
+
+class NullBackend(OutputBackend):
+    # Throws every action away, useful for measuring the engine without the cost of the OS.
+
+    def get_position(self):
+        return 0, 0
+
+    def move_to(self, x, y):
+        pass
+
+    def click(self, button):
+        pass
+
+    def press(self, button):
+        pass
+
+    def wheel(self, delta):
+        pass
+
+    def send(self, hotkey):
+        pass
+
+    def key_down(self, hotkey):
+        pass
+
+    def key_up(self, hotkey):
+        pass
+
+    def submit(self, actions):
+        pass
+
+
+class RecordingBackend(OutputBackend):
+    # Keeps every action in memory as (timestamp, name, args), timestamps come from time.perf_counter().
+
+    def __init__(self, position=(0, 0)):
+        self.position = position
+        self.actions = []
+
+    def record(self, name, *args):
+        self.actions.append((time.perf_counter(), name, args))
+
+    def clear(self):
+        self.actions = []
+
+    def get_position(self):
+        return self.position
+
+    def move_to(self, x, y):
+        self.position = (x, y)
+        self.record("move_to", x, y)
+
+    def click(self, button):
+        self.record("click", button)
+
+    def press(self, button):
+        self.record("press", button)
+
+    def wheel(self, delta):
+        self.record("wheel", delta)
+
+    def send(self, hotkey):
+        self.record("send", hotkey)
+
+    def key_down(self, hotkey):
+        self.record("key_down", hotkey)
+
+    def key_up(self, hotkey):
+        self.record("key_up", hotkey)
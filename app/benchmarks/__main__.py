@@ -0,0 +1,4 @@
+# Lets the benchmark suite run with: python -m benchmarks
+from benchmarks.engine import main
+
+main()
@@ -0,0 +1,203 @@
+# Compares the per-event cost of the old linear-scan key handling with the compiled dispatch table.
+# Run it from the app folder with: python -m benchmarks.dispatch
+# NOTE: The engine runs with the null backend, so nothing is sent to the OS
+# and only the engine's own lookup/parsing overhead is measured.
+# Both paths run the action on the spot against the same backend. The engine itself hands the compiled action
+# to the output worker instead, which isn't part of the comparison.
+# The old path is a copy of the code before the dispatch table existed, actions included, with the mouse and
+# keyboard library calls sent to the backend instead. So it asks the backend for the cursor position on every
+# move, where the new code keeps a virtual cursor.
+# Left out: keyboard_windows_btn, which slept 0.15s on the input thread in the old code (now the wait is
+# scheduled on the output worker), and user made macros, which the old code didn't have.
+
+from pyjoystick import Key
+
+import argparse
+import time
+import backends
+import mapping
+
+
+# Keybinds the old code can't be compared on, see the top of the file.
+SKIPPED_KEYBINDS = ("keyboard_windows_btn",)
+
+
+class LegacyHandler:
+    # A copy of handle_key_event, restructure_params and the generate_* methods before the dispatch table
+    # existed (minus the prints).
+
+    def __init__(self, backend, controls, keybinds, cursor_speed, scroll_speed):
+        self.backend = backend
+        self.controls = controls
+        self.keybinds = keybinds
+        self.cursor_speed = cursor_speed
+        self.scroll_speed = scroll_speed
+
+    def handle_key_event(self, key):
+        for k, v in self.controls.items():
+            if key == v:
+                assigned_key = k
+
+        try:
+            if assigned_key in self.keybinds.keys():
+                self.restructure_params(self.keybinds[assigned_key])
+        except UnboundLocalError:
+            pass
+
+    def restructure_params(self, movement):
+        params = movement.split("_")
+        match params[0]:
+            case "mouse":
+                if params[1] == "scroll" or params[1] == "move":
+                    self.generate_mouse_action(direction=params[2], action=params[1])
+                elif params[2] == "press":
+                    self.generate_mouse_action(direction=params[1], action=params[2])
+                elif params[2] == "click":
+                    self.generate_mouse_action(direction=params[1], action=params[2])
+            case "keyboard":
+                params.pop(0)
+                self.generate_keyboard_action(params)
+            case "summon":
+                if params[1] == "keyboard":
+                    self.backend.send("ctrl+k")
+
+    def generate_mouse_action(self, direction, action):
+        pos_x, pos_y = self.backend.get_position()
+
+        if action == "move":
+            match direction:
+                case "up":
+                    self.backend.move_to(pos_x, pos_y - self.cursor_speed)
+                case "down":
+                    self.backend.move_to(pos_x, pos_y + self.cursor_speed)
+                case "left":
+                    self.backend.move_to(pos_x - self.cursor_speed, pos_y)
+                case "right":
+                    self.backend.move_to(pos_x + self.cursor_speed, pos_y)
+
+        elif action == "click":
+            self.backend.click(direction)
+
+        elif action == "press":
+            self.backend.press(direction)
+
+        elif action == "scroll":
+            match direction:
+                case "up":
+                    self.backend.wheel(self.scroll_speed)
+                case "down":
+                    self.backend.wheel(-self.scroll_speed)
+
+    def generate_keyboard_action(self, key):
+        match key[0]:
+            case "esc":
+                self.backend.send("esc")
+            case "tab":
+                self.backend.send("tab")
+                self.backend.key_up("alt+tab")
+            case "shift":
+                self.backend.send("shift")
+            case "f11":
+                self.backend.send("f11")
+            case "windows":
+                time.sleep(0.15)
+                self.backend.send("cmd")
+
+        # alt keys
+        if key[0] == "alt":
+            match key[1]:
+                case "f4":
+                    self.backend.send("alt+f4")
+                case "tab":
+                    self.backend.key_down("alt+tab")
+
+        # ctrl keys
+        if key[0] == "ctrl":
+            match key[1]:
+                case "c":
+                    self.backend.send("ctrl+c")
+                case "v":
+                    self.backend.send("ctrl+v")
+                case "x":
+                    self.backend.send("ctrl+x")
+                case "a":
+                    self.backend.send("ctrl+a")
+
+        # pg keys
+        if key[0] == "pg":
+            match key[1]:
+                case "up":
+                    self.backend.send("up")
+                case "down":
+                    self.backend.send("down")
+                case "left":
+                    self.backend.send("left")
+                case "right":
+                    self.backend.send("right")
+
+
+def compiled_handle_key_event(generator, key):
+    # handle_key_event, but running the compiled action like the old code did instead of queueing it.
+    bindings = generator.bindings
+    if not bindings.enabled:
+        return
+    action = bindings.actions.get(str(key))
+    if action is not None:
+        action()
+
+
+def make_keys(controls, keybinds):
+    # Builds pyjoystick keys for every control that has a bind the old code could run.
+    # Returns the keys and the keybinds that were skipped.
+    keys = []
+    skipped = []
+    for control, keyname in controls.items():
+        movement = keybinds.get(control, "Empty")
+        if movement in SKIPPED_KEYBINDS or movement.startswith("macro_"):
+            skipped.append(movement)
+        elif movement.split("_")[0] in ("mouse", "keyboard", "summon"):
+            keys.append(Key.from_keyname(keyname))
+    return keys, skipped
+
+
+def time_per_event(handler, keys, events):
+    count = len(keys)
+    start = time.perf_counter_ns()
+    for i in range(events):
+        handler(keys[i % count])
+    return (time.perf_counter_ns() - start) / events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-event cost of ActionGenerator.handle_key_event")
+    parser.add_argument("--events", type=int, default=200000, help="number of events to send per run")
+    args = parser.parse_args()
+
+    controls_dict = mapping.Controls().get()
+    keybinds_class = mapping.Keybinds()
+    keybinds = keybinds_class.return_match(mapping.Presets().get())[0]
+    keybinds_dict = keybinds_class.bind(controls_dict, keybinds)
+
+    generator = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=backends.NullBackend())
+
+    legacy = LegacyHandler(generator.backend, controls_dict, keybinds_dict,
+                           generator.cursor_speed, generator.scroll_speed)
+
+    keys, skipped = make_keys(controls_dict, keybinds_dict)
+    if not keys:
+        print("The active preset has no binds to benchmark")
+        return
+
+    before = time_per_event(legacy.handle_key_event, keys, args.events)
+    after = time_per_event(lambda key: compiled_handle_key_event(generator, key), keys, args.events)
+
+    print(f"events: {args.events} over {len(keys)} bound controls")
+    if skipped:
+        print(f"skipped (not comparable with the old code): {', '.join(skipped)}")
+    print(f"old code (linear scan + parse, cursor position from the backend): {before:.0f} ns/event")
+    print(f"compiled dispatch (virtual cursor):                               {after:.0f} ns/event")
+    print(f"speedup:             {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Latency and throughput benchmarks for the whole engine, no controller needed.
+# Synthetic controller keys are fed to a running ActionGenerator through a stand-in event manager,
+# and the actions it generates are timed by an instrumented backend.
+# Run it from the app folder with: python -m benchmarks [--events N] [--output results.json]
+# The results go to data/bench_results.json unless --output says otherwise, git ignores that file.
+
+from pyjoystick import Key
+
+import json
+import os
+import platform
+import threading
+import time
+import backends
+import mapping
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "bench_results.json")
+
+
+class InstrumentedBackend(backends.NullBackend):
+    # Doesn't send anything to the OS, but remembers when every action arrived.
+
+    def __init__(self):
+        self.action_times = []
+        self.action_done = threading.Event()
+
+    def record(self, *args):
+        self.action_times.append(time.perf_counter())
+        self.action_done.set()
+
+    move_to = click = press = wheel = send = key_down = key_up = record
+
+    def submit(self, actions):
+        for _ in actions:
+            self.record()
+
+
+class SyntheticEventManager:
+    # Hands out a list of keys through find_key(), like pyjoystick's ThreadEventManager would.
+    # When paced, a key is only handed out after the previous one produced an action (or timed out),
+    # so every action can be matched to the key that caused it.
+
+    def __init__(self, keys, backend, paced, action_timeout=0.1):
+        self.keys = keys
+        self.backend = backend
+        self.paced = paced
+        self.action_timeout = action_timeout
+        self.joysticks = []
+        self.position = 0
+        self.sent_times = []
+        self.finished = threading.Event()
+        self.stopped = threading.Event()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.stopped.set()
+
+    def find_key(self, timeout=float('inf')):
+        if self.paced and self.position > 0:
+            self.backend.action_done.wait(self.action_timeout)
+        self.backend.action_done.clear()
+
+        if self.position >= len(self.keys):
+            self.finished.set()
+            self.stopped.wait()
+            return None
+
+        key = self.keys[self.position]
+        self.position += 1
+        self.sent_times.append(time.perf_counter())
+        return key
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def get_preset():
+    # Returns the controls and the keybinds of the preset that's in use.
+    controls_dict = mapping.Controls().get()
+    keybinds_class = mapping.Keybinds()
+    keybinds = keybinds_class.return_match(mapping.Presets().get())[0]
+    return controls_dict, keybinds_class.bind(controls_dict, keybinds)
+
+
+def make_keys(controls_dict, keybinds_dict, count):
+    # Builds a stream of keys that cycles through every control with a bind.
+    # NOTE: The windows key is left out since it's pressed 150ms later on purpose.
+    keynames = [keyname for control, keyname in controls_dict.items()
+                if keybinds_dict.get(control, "Empty") not in ("Empty", "keyboard_windows_btn")]
+    return [Key.from_keyname(keynames[i % len(keynames)]) for i in range(count)]
+
+
+def wait_for_output(action_generator, timeout=10.0):
+    # Waits until the output worker has run everything that was queued (delayed actions included).
+    output = action_generator.output
+    deadline = time.perf_counter() + timeout
+    while (len(action_generator.action_queue) or output.scheduled) and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+
+def run_engine(controls_dict, keybinds_dict, keys, paced):
+    # Runs the engine until every key has been handled and its action has run.
+    # Returns the backend, manager, the generator (stopped) and the time it took.
+    backend = InstrumentedBackend()
+    mngr = SyntheticEventManager(keys, backend, paced)
+    action_generator = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=backend, event_manager=mngr)
+
+    start = time.perf_counter()
+    action_generator.start()
+    mngr.finished.wait()
+    wait_for_output(action_generator)
+    # Stopping joins the output worker, so the action it was running is done too.
+    action_generator.stop()
+    end = max(backend.action_times[-1] if backend.action_times else 0.0, mngr.sent_times[-1])
+    return backend, mngr, action_generator, end - start
+
+
+def measure_latency(controls_dict, keybinds_dict, count):
+    # Sends keys one at a time and measures how long it took for each to become an action.
+    keys = make_keys(controls_dict, keybinds_dict, count)
+    backend, mngr, _, _ = run_engine(controls_dict, keybinds_dict, keys, paced=True)
+
+    # Pairs every key with the first action that came after it, keys without an action are skipped.
+    latencies = []
+    action_index = 0
+    sent_times = mngr.sent_times + [float('inf')]
+    for sent, next_sent in zip(sent_times, sent_times[1:]):
+        while action_index < len(backend.action_times) and backend.action_times[action_index] < sent:
+            action_index += 1
+        if action_index < len(backend.action_times) and backend.action_times[action_index] < next_sent:
+            latencies.append(backend.action_times[action_index] - sent)
+
+    return {
+        "events": count,
+        "matched_actions": len(latencies),
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p95_us": percentile(latencies, 95) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "max_us": max(latencies) * 1e6
+    }
+
+
+def measure_throughput(controls_dict, keybinds_dict, count):
+    # Floods the engine with keys and measures how many actions it gets through every second,
+    # from the first key until the last action has run. Dropped actions don't count.
+    keys = make_keys(controls_dict, keybinds_dict, count)
+    backend, _, action_generator, elapsed = run_engine(controls_dict, keybinds_dict, keys, paced=False)
+    stats = action_generator.queue_stats()
+    completed = action_generator.output.completed
+    return {
+        "events": count,
+        "actions": completed,
+        "dropped": stats["dropped"],
+        "coalesced": stats["coalesced"],
+        "errors": stats["errors"],
+        "backend_calls": len(backend.action_times),
+        "seconds": elapsed,
+        "actions_per_second": completed / elapsed
+    }
+
+
+def time_stage(func, items):
+    start = time.perf_counter_ns()
+    for item in items:
+        func(item)
+    return (time.perf_counter_ns() - start) / len(items)
+
+
+def measure_stages(controls_dict, keybinds_dict, count):
+    # Times every stage an event goes through on its own, in nanoseconds per event.
+    keys = make_keys(controls_dict, keybinds_dict, count)
+    action_generator = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=backends.NullBackend())
+    dispatch = action_generator.bindings.dispatch
+    action_queue = action_generator.action_queue
+
+    # Repeat handling: the bookkeeping the repeat scheduler does for every key.
+    repeat_ns = time_stage(action_generator.repeater.set, keys)
+
+    # Dispatch: turning a key into its compiled action.
+    dispatch_ns = time_stage(lambda key: dispatch.get(str(key)), keys)
+
+    # Queue: handing the action to the output worker (and taking it back out, as the worker would).
+    submits = [dispatch[str(key)] for key in keys if str(key) in dispatch]
+    queue_ns = time_stage(lambda submit: (submit(), action_queue.get()), submits)
+
+    # Output: running the compiled action down to the (null) backend.
+    actions = [action_generator.bindings.actions[str(key)] for key in keys if str(key) in dispatch]
+    output_ns = time_stage(lambda action: action(), actions)
+
+    return {
+        "dispatch_ns": dispatch_ns,
+        "repeat_ns": repeat_ns,
+        "queue_ns": queue_ns,
+        "output_ns": output_ns
+    }
+
+
+def measure_swap(controls_dict, keybinds_dict, count=200):
+    # Cost of switching presets: compiling a preset into a snapshot and swapping it in, in microseconds.
+    action_generator = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=backends.NullBackend())
+    swaps = []
+    for _ in range(count):
+        start = time.perf_counter()
+        action_generator.keybinds = keybinds_dict
+        swaps.append((time.perf_counter() - start) * 1e6)
+    return {
+        "swaps": count,
+        "mean_us": sum(swaps) / count,
+        "p50_us": percentile(swaps, 50),
+        "p99_us": percentile(swaps, 99)
+    }
+
+
+def run_suite(events):
+    controls_dict, keybinds_dict = get_preset()
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": measure_latency(controls_dict, keybinds_dict, min(events, 2000)),
+        "throughput": measure_throughput(controls_dict, keybinds_dict, events),
+        "stages": measure_stages(controls_dict, keybinds_dict, events),
+        "swap": measure_swap(controls_dict, keybinds_dict)
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Engine latency and throughput benchmarks")
+    parser.add_argument("--events", type=int, default=20000, help="number of synthetic events per run")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="where to write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_suite(args.events)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+
+    latency = results["latency"]
+    throughput = results["throughput"]
+    stages = results["stages"]
+    print(f"latency: p50 {latency['p50_us']:.0f}us, p95 {latency['p95_us']:.0f}us, p99 {latency['p99_us']:.0f}us "
+          f"({latency['matched_actions']} of {latency['events']} events)")
+    print(f"throughput: {throughput['actions_per_second']:.0f} actions/s "
+          f"({throughput['actions']} of {throughput['events']} events, {throughput['dropped']} dropped)")
+    print(f"stages: dispatch {stages['dispatch_ns']:.0f}ns, repeat {stages['repeat_ns']:.0f}ns, "
+          f"queue {stages['queue_ns']:.0f}ns, output {stages['output_ns']:.0f}ns")
+    print(f"preset switch: p50 {results['swap']['p50_us']:.0f}us, p99 {results['swap']['p99_us']:.0f}us")
+    print(f"results written to {args.output}")
@@ -0,0 +1,135 @@
+# Recognizes chords (controls pressed together, e.g. "L1+CROSS") and combos (controls pressed one after another,
+# e.g. "DPAD_DOWN>DPAD_RIGHT>SQUARE") so they can have their own keybinds.
+# Bindings are compiled into a trie of raw controller keys. A key that doesn't start any chord or combo never
+# reaches the matcher and fires right away, only keys that could be the start of one wait to see what comes next.
+# Repeats of held keys are never part of a chord/combo, they fire their key's own action.
+
+import time
+
+# Longest gap between the keys of a chord, and between the keys of a combo, in seconds.
+CHORD_WINDOW = 0.2
+COMBO_WINDOW = 0.5
+
+
+def parse_trigger(trigger):
+    # Splits a chord/combo into its controls, returns (controls, is_chord).
+    if ">" in trigger:
+        return trigger.split(">"), False
+    return trigger.split("+"), True
+
+
+class TrieNode:
+    def __init__(self):
+        self.children = {}  # raw key name to TrieNode
+        self.action = None
+        self.window = COMBO_WINDOW
+
+
+class ChordMatcher:
+    # Feeds on the keys that start or continue a chord/combo.
+    # singles are the actions of single controls, used when keys turn out not to be part of a chord/combo.
+
+    def __init__(self, singles):
+        self.root = TrieNode()
+        self.singles = singles
+        self.node = self.root
+        self.pending = []  # keys taken so far by the chord/combo being matched
+        self.deadline = None
+
+    def add(self, keynames, action, is_chord):
+        # A chord can be pressed in any order, so every order is added to the trie.
+        sequences = [keynames]
+        window = COMBO_WINDOW
+        if is_chord:
+            sequences = permutations(keynames)
+            window = CHORD_WINDOW
+
+        for sequence in sequences:
+            node = self.root
+            for keyname in sequence:
+                node = node.children.setdefault(keyname, TrieNode())
+                node.window = min(node.window, window)
+            node.action = action
+
+    def get_starting_keys(self):
+        return list(self.root.children)
+
+    def get_timeout(self):
+        # Seconds until the chord/combo being matched runs out of time, None if nothing is being matched.
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def press(self, keyname, is_repeat=False):
+        # Always True: the key is taken, even if it's held back. Returned like the output worker's put(),
+        # since the dispatch table's entries say whether their key made it.
+        now = time.monotonic()
+        if self.pending and (now > self.deadline or (is_repeat and keyname in self.pending)):
+            # A held key repeating means nothing else was pressed in time, the same as running out of time.
+            self.expire()
+        if is_repeat:
+            self.fire_single(keyname)
+            return True
+
+        node = self.node.children.get(keyname)
+        if node is None:
+            if self.pending:
+                # Not part of anything longer, the keys so far fire as the chord/combo they make or on their own,
+                # and this key starts over.
+                self.expire()
+                self.press(keyname)
+                return True
+            self.fire_single(keyname)
+            return True
+
+        self.pending.append(keyname)
+        if node.action is not None and not node.children:
+            # Nothing longer can match, no need to wait.
+            self.reset()
+            node.action()
+            return True
+
+        self.node = node
+        self.deadline = now + node.window
+        return True
+
+    def expire(self):
+        # Called when time's up. Fires the chord/combo if the keys so far make one, else the held back keys.
+        if not self.pending:
+            return
+        node = self.node
+        if node.action is not None:
+            self.reset()
+            node.action()
+        else:
+            self.fail()
+
+    def expire_if_due(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.expire()
+
+    def fail(self):
+        pending = self.pending
+        self.reset()
+        for keyname in pending:
+            self.fire_single(keyname)
+
+    def fire_single(self, keyname):
+        action = self.singles.get(keyname)
+        if action is not None:
+            action()
+
+    def reset(self):
+        self.node = self.root
+        self.pending = []
+        self.deadline = None
+
+
+def permutations(items):
+    if len(items) <= 1:
+        return [list(items)]
+    result = []
+    for index, item in enumerate(items):
+        for rest in permutations(items[:index] + items[index + 1:]):
+            result.append([item] + rest)
+    return result
@@ -0,0 +1,68 @@
+# A small binary file with the config that's in use (the enabled preset's keybinds, chords and combos, macros
+# and tuning), so the engine can start handling input without waiting for the database or the GUI.
+# The app rewrites it whenever the config changes, see ConfigCache in db_setup.py.
+#
+# The config is a dictionary in the same shape the GUI sends to an engine process (see engine_process.py),
+# plus "controls", the names of the controls in order, and "preset", the enabled preset's name.
+# It's stored with marshal behind a header that's checked when it's loaded. A snapshot that's missing, damaged
+# or from another version of Python loads as None, and the engine reads the database like it used to.
+
+import marshal
+import os
+import struct
+import zlib
+
+import logger
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "config.snapshot")
+MAGIC = b"CFWS"
+FORMAT_VERSION = 1
+# magic, format version, marshal version, length of the config, crc32 of the config
+HEADER = struct.Struct("<4sHHII")
+
+log = logger.get_logger("snapshot")
+
+
+def dump(config):
+    payload = marshal.dumps(config)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, len(payload), zlib.crc32(payload)) + payload
+
+
+def parse(data):
+    # Returns the config, or None if the data isn't a snapshot this version of the app can read.
+    if len(data) < HEADER.size:
+        return None
+    magic, format_version, marshal_version, length, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC or format_version != FORMAT_VERSION or marshal_version != marshal.version:
+        return None
+    payload = data[HEADER.size:HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        return None
+    try:
+        return marshal.loads(payload)
+    except (ValueError, EOFError, TypeError):
+        return None
+
+
+def write(config, path=SNAPSHOT_PATH):
+    # Replaces the snapshot in one step, so whoever reads it never sees half of one.
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(dump(config))
+        os.replace(temp_path, path)
+    except OSError as error:
+        # The engine falls back to the database, so a snapshot that can't be written isn't a problem.
+        log.warning("snapshot_not_written", path=path, error=str(error))
+
+
+def load(path=SNAPSHOT_PATH):
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    config = parse(data)
+    if config is None:
+        log.warning("snapshot_invalid", path=path)
+    return config
@@ -0,0 +1,154 @@
+# Writes the GUI's config changes to the database from a background thread, so the GUI never waits on the disk.
+# A write is held back for a moment in case more come (a slider being dragged, keybinds being edited one after
+# another), and a write that replaces one that's still waiting, like the same keybind set twice, takes its place.
+# Everything that's waiting is then written in one transaction.
+#
+# ConfigCache hands its writes here after start_writer(), see db_setup.py. The cache is updated right away,
+# so reads never see the database falling behind. stop() writes whatever is left, and it's also called
+# when the interpreter exits, so a change can't be lost by closing the app.
+
+import atexit
+import sqlite3
+import threading
+import time
+
+import logger
+
+# Seconds without a new write before the waiting ones are written
+DEBOUNCE_DELAY = 0.25
+# Most seconds a write waits while new ones keep coming
+MAX_DELAY = 2.0
+# Seconds before writes that failed (e.g. the database was locked) are tried again
+RETRY_DELAY = 2.0
+
+log = logger.get_logger("config_writer")
+
+
+class ConfigWriter:
+    # write is called with a list of (statement, rows of parameters) to run in one transaction, after_write
+    # once they're in the database, or after mark_changed() if nothing was waiting.
+
+    def __init__(self, write, after_write=None, delay=DEBOUNCE_DELAY, max_delay=MAX_DELAY):
+        self.write = write
+        self.after_write = after_write
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.pending = {}  # key to (statement, rows), in the order they're written
+        self.is_changed = False
+        self.first_time = None  # when the oldest waiting change came in
+        self.last_time = None
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()  # keeps batches in order when flush() is called from another thread
+        self.thread = None
+        self._is_running = False
+
+        self.batches = 0
+        self.coalesced = 0  # writes that were replaced before they were written
+
+    def put(self, key, stmt, rows, replaces=()):
+        # Keys say what a write changes, a write replaces a waiting one with the same key or one in replaces.
+        with self.condition:
+            for old_key in (key, *replaces):
+                if self.pending.pop(old_key, None) is not None:
+                    self.coalesced += 1
+            # Goes last, after anything it was written after
+            self.pending[key] = (stmt, rows)
+            self.mark_changed()
+
+    def mark_changed(self):
+        # For changes that were written right away, so after_write still gets called.
+        with self.condition:
+            now = time.monotonic()
+            if not self.is_changed:
+                self.first_time = now
+            self.last_time = now
+            self.is_changed = True
+            self.condition.notify()
+
+    def flush(self):
+        # Writes everything that's waiting, returns once it's in the database.
+        # If the write fails, the writes are put back in front of the ones that came in meanwhile and
+        # the error is raised.
+        with self.flush_lock:
+            with self.condition:
+                batch = self.pending
+                is_changed = self.is_changed
+                self.pending = {}
+                self.is_changed = False
+            if batch:
+                started = time.perf_counter()
+                try:
+                    self.write(list(batch.values()))
+                except BaseException:
+                    self.put_back(batch)
+                    raise
+                self.batches += 1
+                log.debug("config_written", writes=len(batch), ms=round((time.perf_counter() - started) * 1000, 2))
+        # Outside the lock, after_write may have to wait for whoever is calling flush().
+        if is_changed and self.after_write is not None:
+            self.after_write()
+
+    def put_back(self, batch):
+        # A write that came in while the batch was being written is newer, so it goes after the batch
+        # and takes the place of the batch's write with the same key.
+        with self.condition:
+            pending = {key: write for key, write in batch.items() if key not in self.pending}
+            pending.update(self.pending)
+            self.pending = pending
+            if not self.is_changed:
+                self.first_time = time.monotonic()
+            self.last_time = time.monotonic()
+            self.is_changed = True
+
+    def try_flush(self):
+        # flush(), but an error is logged instead of raised, the writes then wait for the next try.
+        # Returns whether everything was written.
+        try:
+            self.flush()
+            return True
+        except sqlite3.Error as error:
+            # The cache still has the changes, they're just not saved yet.
+            log.error("config_not_written", writes=len(self.pending), error=str(error))
+            return False
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self._is_running and not self.is_changed:
+                    self.condition.wait()
+                if not self._is_running:
+                    return
+                # Waits until the writes stop coming, or the oldest one has waited long enough.
+                while self._is_running and self.is_changed:
+                    remaining = min(self.last_time + self.delay, self.first_time + self.max_delay) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+            if not self.try_flush():
+                with self.condition:
+                    if self._is_running:
+                        self.condition.wait(RETRY_DELAY)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self._is_running = True
+        self.thread = threading.Thread(target=self.run, name="ConfigWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Stops the thread and writes what's left. Writes that fail even then are logged and lost,
+        # it doesn't raise so whoever is exiting can go on.
+        thread = self.thread
+        if thread is None:
+            return
+        with self.condition:
+            self._is_running = False
+            self.condition.notify()
+        thread.join()
+        self.thread = None
+        atexit.unregister(self.stop)
+        self.try_flush()
+        log.info("config_writer_stopped", batches=self.batches, coalesced=self.coalesced)
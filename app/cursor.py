@@ -0,0 +1,262 @@
+# Moves the cursor with the analog sticks instead of the repeater.
+# Rather than jumping a fixed amount of pixels everytime an "Axis" event repeats, the stick is read
+# on a fixed-rate tick and the cursor speed follows how far the stick is pushed.
+
+import ctypes
+import threading
+import time
+
+# Tick rates (in Hz) that the analog cursor can run at.
+CURSOR_RATES = (60, 120, 240)
+
+# Direction of the cursor for every "mouse_move_*" keybind.
+MOVE_DIRECTIONS = {
+    "up": (0, -1),
+    "down": (0, 1),
+    "left": (-1, 0),
+    "right": (1, 0)
+}
+
+
+def get_screen_bounds():
+    # Returns the left, top, right and bottom edges of the desktop (every monitor combined).
+    # Returns None where the Windows API isn't available, in which case the cursor is left unclamped.
+    try:
+        user32 = ctypes.windll.user32
+    except AttributeError:
+        return None
+
+    # SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN
+    left = user32.GetSystemMetrics(76)
+    top = user32.GetSystemMetrics(77)
+    width = user32.GetSystemMetrics(78)
+    height = user32.GetSystemMetrics(79)
+    return left, top, left + width - 1, top + height - 1
+
+
+def parse_axis(keyname):
+    # Splits a raw axis key (e.g. "-Axis 1") into its axis number and the side of the stick it's on.
+    # Returns None for anything that isn't an axis, like buttons and hats.
+    sign = 1
+    if keyname.startswith("-"):
+        sign = -1
+        keyname = keyname[1:]
+
+    key_info = keyname.split(" ")
+    if key_info[0] != "Axis":
+        return None
+    return int(key_info[1]), sign
+
+
+class AnalogCursor(threading.Thread):
+    # Integrates stick position into cursor velocity on its own tick.
+    # Sub-pixel movement is carried over to the next tick, and only one move is sent to the OS per tick.
+    # Several controllers can share the cursor (see shards.py), each one is a source with its own sticks
+    # and axes, and their movement adds up.
+
+    # Axis values below this are treated as a centered stick.
+    DEADZONE = 0.1
+
+    def __init__(self, read_axis, move_by, speed, rate=120, sample=None, deadzone=DEADZONE):
+        threading.Thread.__init__(self)
+        # read_axis: takes an axis number and returns its value from -1.0 to 1.0
+        # move_by: takes the amount of pixels to move the cursor on x and y
+        # sample: called once at the start of every tick, before the axes are read (e.g. to filter them)
+        # read_axis and sample are those of the default source (None), a cursor without one gets its
+        # sources from add_source().
+        self.move_by = move_by
+        self.deadzone = deadzone
+        self.speed = speed  # pixels per second with the stick pushed all the way
+        self.set_rate(rate)
+
+        # Source to (read_axis, sample, axes), axes being a list of
+        # (axis number, side of the stick, x direction, y direction). Replaced, never changed in place,
+        # so the cursor's thread can go through it while sources come and go.
+        self.sources = {}
+        self.sources_lock = threading.Lock()  # taken by whoever replaces sources
+        if read_axis is not None:
+            self.add_source(None, read_axis, sample)
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
+
+        self._has_axes = threading.Event()
+        self._is_running = True
+        self.daemon = True
+
+    def set_rate(self, rate):
+        if rate not in CURSOR_RATES:
+            raise ValueError(f"Cursor rate must be one of {CURSOR_RATES}, got {rate}")
+        self.rate = rate
+        self.interval = 1 / rate
+
+    def add_source(self, source, read_axis, sample=None):
+        # A source is anything that tells the controllers apart, e.g. their ActionGenerator.
+        with self.sources_lock:
+            self.sources = {**self.sources, source: (read_axis, sample, [])}
+
+    def remove_source(self, source):
+        with self.sources_lock:
+            sources = dict(self.sources)
+            sources.pop(source, None)
+            self.sources = sources
+            self.update_has_axes()
+
+    def set_axes(self, axes, source=None):
+        # Sets which axes of a source move the cursor. The thread sleeps without ticking while there are none.
+        with self.sources_lock:
+            if source not in self.sources:
+                # Removed, e.g. a controller's generator that's been stopped
+                return
+            read_axis, sample, _ = self.sources[source]
+            self.sources = {**self.sources, source: (read_axis, sample, axes)}
+            self.remainder_x = 0.0
+            self.remainder_y = 0.0
+            self.update_has_axes()
+
+    def update_has_axes(self):
+        if any(axes for _, _, axes in self.sources.values()):
+            self._has_axes.set()
+        else:
+            self._has_axes.clear()
+
+    def stop(self):
+        self._is_running = False
+        self._has_axes.set()
+
+    def step(self, delta_time):
+        # Reads the sticks once and moves the cursor by however many whole pixels have built up.
+        velocity_x = 0.0
+        velocity_y = 0.0
+        for read_axis, sample, axes in self.sources.values():
+            if not axes:
+                continue
+            if sample is not None:
+                sample()
+            for number, sign, direction_x, direction_y in axes:
+                value = read_axis(number) * sign
+                if value > self.deadzone:
+                    velocity_x += value * direction_x
+                    velocity_y += value * direction_y
+
+        self.remainder_x += velocity_x * self.speed * delta_time
+        self.remainder_y += velocity_y * self.speed * delta_time
+        move_x = int(self.remainder_x)
+        move_y = int(self.remainder_y)
+        self.remainder_x -= move_x
+        self.remainder_y -= move_y
+
+        if move_x or move_y:
+            self.move_by(move_x, move_y)
+
+    def run(self):
+        next_tick = time.monotonic()
+        while self._is_running:
+            if not self._has_axes.is_set():
+                self._has_axes.wait()
+                next_tick = time.monotonic()
+                continue
+
+            self.step(self.interval)
+
+            # Sleeps until the next tick. If a tick took too long, the schedule starts over from now
+            # instead of trying to catch up with a burst of moves.
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+
+class VirtualCursor(threading.Thread):
+    # Keeps its own copy of the cursor position so that moving the cursor doesn't have to ask the OS
+    # where it is first. The position is only synced with the OS after the cursor has been still for a while,
+    # since that's when the real mouse could have moved it.
+    # A move from the D-pad/repeater is sent right away, the moves that arrive during the tick after it
+    # are combined into a single (e.g. diagonal) move, so there's at most one OS call per tick.
+
+    # Seconds without any movement before the position is synced with the OS again.
+    RESYNC_TIMEOUT = 0.5
+
+    def __init__(self, get_position, move_to, rate=120, get_bounds=get_screen_bounds):
+        threading.Thread.__init__(self)
+        self.get_position = get_position
+        self.move_to = move_to
+        self.get_bounds = get_bounds
+        self.set_rate(rate)
+
+        self.x = 0
+        self.y = 0
+        self.bounds = None
+        self.last_move = None  # time of the last move, None until the first sync
+
+        self.pending_x = 0
+        self.pending_y = 0
+        self.lock = threading.Lock()
+        # Held from working out a move until it's sent, so moves reach the OS in the order of their positions.
+        # nudge() only takes the other lock, so it never waits for the OS.
+        self.send_lock = threading.Lock()
+        self._has_pending = threading.Event()
+        self._is_running = True
+        self.daemon = True
+
+    def set_rate(self, rate):
+        if rate not in CURSOR_RATES:
+            raise ValueError(f"Cursor rate must be one of {CURSOR_RATES}, got {rate}")
+        self.rate = rate
+        self.interval = 1 / rate
+
+    def stop(self):
+        self._is_running = False
+        self._has_pending.set()
+
+    def sync(self):
+        # Gets the real cursor position and screen size from the OS.
+        self.x, self.y = self.get_position()
+        self.bounds = self.get_bounds()
+
+    def clamp(self, x, y):
+        if self.bounds is None:
+            return x, y
+        left, top, right, bottom = self.bounds
+        return min(max(x, left), right), min(max(y, top), bottom)
+
+    def move_by(self, x, y):
+        # Moves the cursor right away with a single OS call.
+        # The analog cursor and the tick both call this, from their own threads.
+        with self.send_lock:
+            with self.lock:
+                now = time.monotonic()
+                if self.last_move is None or now - self.last_move > self.RESYNC_TIMEOUT:
+                    self.sync()
+                self.last_move = now
+
+                new_x, new_y = self.clamp(self.x + x, self.y + y)
+                if new_x == self.x and new_y == self.y:
+                    return
+                self.x, self.y = new_x, new_y
+            self.move_to(new_x, new_y)
+
+    def nudge(self, x, y):
+        # Adds to the movement that will be sent on the next tick.
+        with self.lock:
+            self.pending_x += x
+            self.pending_y += y
+        self._has_pending.set()
+
+    def flush(self):
+        # Sends everything that was nudged since the last tick as one move.
+        with self.lock:
+            x, y = self.pending_x, self.pending_y
+            self.pending_x = 0
+            self.pending_y = 0
+            self._has_pending.clear()
+        if x or y:
+            self.move_by(x, y)
+
+    def run(self):
+        while self._is_running:
+            self._has_pending.wait()
+            self.flush()
+            # Whatever is nudged until the next tick waits for it.
+            time.sleep(self.interval)
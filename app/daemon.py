@@ -0,0 +1,288 @@
+# Runs the controller engine on its own, without the window or Qt, for machines that only need controller
+# input turned into keyboard and mouse actions.
+# It uses the saved config: the config_snapshot if there is one, the database otherwise.
+#
+# Usage (from the app folder):
+#   python daemon.py                 runs the engine until it's stopped
+#   python daemon.py send <command>  sends a command to the daemon that's running and prints the reply
+#
+# Commands:
+#   status          pid, uptime, resident memory, startup time, controllers and the preset in use
+#   enable, disable turns input translation on or off
+#   reload          reads the saved config from the database again
+#   preset <name>   enables another preset and switches to it
+#   stop            stops the daemon
+#
+# The daemon listens for commands on a local connection, its port and key are written to data/daemon.address
+# (which only the user can read) while it runs. On POSIX it also takes signals: SIGTERM and SIGINT stop it,
+# SIGHUP reloads, SIGUSR1 disables and SIGUSR2 enables.
+
+import startup  # first, so its clock includes the other imports
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import config_snapshot
+import engine_process
+import logger
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+ADDRESS_PATH = os.path.join(DATA_PATH, "daemon.address")
+LOG_PATH = os.path.join(DATA_PATH, "daemon.log")
+
+log = logger.get_logger("daemon")
+
+
+def get_resident_memory():
+    # Bytes of the process that are in RAM, or None if it can't be told on this platform.
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        if ctypes.windll.psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Only the peak is available here, in bytes on macOS and kilobytes elsewhere.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_memory(size):
+    return "unknown" if size is None else f"{size / (1024 * 1024):.1f} MB"
+
+
+class Daemon:
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.engine = None
+        self.config = None
+        self.listener = None
+        self.started = time.monotonic()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()  # commands come from the listener's thread and from signals
+
+    def load_config(self, from_database=False):
+        config = None if from_database else config_snapshot.load()
+        if config is None:
+            import db_setup
+            db_setup.config.invalidate()
+            config = db_setup.config.get_active_config()
+        if config is None:
+            raise RuntimeError("There are no presets saved yet, open the app once to create one")
+        return config
+
+    def start(self):
+        self.config = self.load_config()
+        self.profiler.mark("config")
+
+        import mapping
+        import shards
+        controls = dict(zip(self.config["controls"], mapping.definitions))
+        self.engine = shards.ShardedEngine(None, controls, tuning_values=self.config["tuning"])
+        engine_process.apply_config(self.engine, self.config)
+        self.engine.start()
+        self.profiler.mark("engine")
+
+        key = os.urandom(32)
+        self.listener = Listener(("localhost", 0), authkey=key)
+        self.write_address(self.listener.address[1], key)
+        threading.Thread(target=self.serve, name="DaemonCommands", daemon=True).start()
+        self.profiler.mark("commands")
+        log.info("daemon_started", preset=self.config["preset"], rss=get_resident_memory())
+
+    @staticmethod
+    def write_address(port, key):
+        # Created readable only by the user, anyone who has the key can control the daemon.
+        descriptor = os.open(ADDRESS_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({"pid": os.getpid(), "port": port, "key": key.hex()}, file)
+
+    def reload(self):
+        with self.lock:
+            config = self.load_config(from_database=True)
+            if config["controls"] != self.config["controls"]:
+                # The shards were made for the old controls, restarting the daemon picks up the new ones.
+                log.warning("controls_changed", old=len(self.config["controls"]), new=len(config["controls"]))
+            config["enabled"] = self.config["enabled"]
+            engine_process.apply_config(self.engine, config)
+            self.config = config
+        log.info("config_reloaded", preset=config["preset"])
+        return f"Reloaded preset {config['preset']}"
+
+    def set_enabled(self, enabled):
+        with self.lock:
+            self.config["enabled"] = enabled
+            if enabled:
+                self.engine.enable()
+            else:
+                self.engine.disable()
+        log.info("daemon_enabled" if enabled else "daemon_disabled")
+        return "Enabled" if enabled else "Disabled"
+
+    def set_preset(self, name):
+        import db_setup
+        db_setup.config.get_preset_id(name)  # KeyError if there's no such preset
+        # The daemon changed the saved config, so the snapshot has to follow it.
+        db_setup.config.snapshot_path = config_snapshot.SNAPSHOT_PATH
+        db_setup.config.activate_preset(name)
+        return self.reload()
+
+    def get_status(self):
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.monotonic() - self.started, 1),
+            "rss": get_resident_memory(),
+            "startup_ms": round(self.profiler.get_elapsed() * 1000, 1),
+            "enabled": self.config["enabled"],
+            "preset": self.config["preset"],
+            "devices": [info.name for info in self.engine.devices.get_devices()]
+        }
+
+    def handle(self, command):
+        # Returns (True, reply) or (False, error message).
+        name, args = command[0], command[1:]
+        try:
+            match name, len(args):
+                case "status", 0:
+                    return True, self.get_status()
+                case "enable", 0:
+                    return True, self.set_enabled(True)
+                case "disable", 0:
+                    return True, self.set_enabled(False)
+                case "reload", 0:
+                    return True, self.reload()
+                case "preset", 1:
+                    return True, self.set_preset(args[0])
+                case "stop", 0:
+                    self.stopped.set()
+                    return True, "Stopping"
+        except (KeyError, RuntimeError) as error:
+            return False, error.args[0] if error.args else str(error)
+        except Exception as error:
+            # e.g. the database failing, the daemon keeps answering commands
+            log.error("command_failed", command=" ".join(command), error=repr(error))
+            return False, f"{name} failed: {error}"
+        return False, f"Unknown command: {' '.join(command)}"
+
+    def serve(self):
+        while not self.stopped.is_set():
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if self.stopped.is_set():
+                    return
+                continue
+            with connection:
+                try:
+                    command = connection.recv()
+                    connection.send(self.handle(command) if command else (False, "No command"))
+                except (OSError, EOFError):
+                    pass
+
+    def handle_signals(self):
+        def stop(signum, frame):
+            self.stopped.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        # Not on Windows
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.run_safely(self.reload))
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.set_enabled(False))
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.set_enabled(True))
+
+    @staticmethod
+    def run_safely(command):
+        try:
+            command()
+        except Exception as error:
+            log.error("command_failed", error=repr(error))
+
+    def run(self, print_report=True):
+        self.handle_signals()
+        self.start()
+        self.profiler.report()
+        if print_report:
+            print(self.profiler.format())
+            print(f"{'memory':>10}: {format_memory(get_resident_memory())}")
+        # Waits with a timeout so that Ctrl+C gets through on Windows too.
+        while not self.stopped.wait(0.5):
+            pass
+        self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        if self.engine is not None:
+            self.engine.stop()
+        if self.listener is not None:
+            self.listener.close()
+        try:
+            os.remove(ADDRESS_PATH)
+        except OSError:
+            pass
+        log.info("daemon_stopped")
+
+
+def send_command(command):
+    # Sends a command to the daemon that's running, returns (ok, reply).
+    try:
+        with open(ADDRESS_PATH) as file:
+            address = json.load(file)
+        with Client(("localhost", address["port"]), authkey=bytes.fromhex(address["key"])) as connection:
+            connection.send(command)
+            return connection.recv()
+    except (OSError, EOFError, ValueError, KeyError, AuthenticationError):
+        return False, "The daemon isn't running"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the controller engine without the window.")
+    parser.add_argument("--quiet", action="store_true", help="don't print the startup time and memory")
+    subparsers = parser.add_subparsers(dest="action")
+    send_parser = subparsers.add_parser("send", help="send a command to the daemon that's running")
+    send_parser.add_argument("command", nargs="+", help="status, enable, disable, reload, preset <name> or stop")
+    args = parser.parse_args()
+
+    if args.action == "send":
+        ok, reply = send_command(args.command)
+        print(json.dumps(reply, indent=2) if isinstance(reply, dict) else reply)
+        sys.exit(0 if ok else 1)
+
+    profiler = startup.StartupProfiler()
+    profiler.mark("imports")
+    logger.start_writer(LOG_PATH)
+    try:
+        Daemon(profiler).run(print_report=not args.quiet)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        logger.stop_writer()
@@ -1,116 +1,179 @@
 import sqlite3
 import os
-
-# Goes to the path of the project according to the location of this file.
+import threading
+from contextlib import contextmanager
+import config_snapshot
+import config_writer
+import cursor
+import logger
+import macros
+
+# Finds the database from the location of this file, so the program can be run from any directory.
 # NOTE: Don't put this file outside of its original directory or the program breaks due to path errors.
 from pathlib import Path
 path = Path(__file__)
 project_path = path.parent.absolute()
-os.chdir(project_path)
 
-db_path = "data"
+db_path = str(project_path / "data")
 db_name = "controls.db"
 db = f"{db_path}/{db_name}"
 
-class DBcmds:
-    # Holds all the methods needed to manipulate the database 
-    def __init__(self) -> None:
-        self.open_db()
+log = logger.get_logger("db")
+
+class Connections:
+    # Keeps one open connection to the database per thread instead of opening and closing one for every command.
+    # Every connection is in WAL mode, so the engine can read while the GUI is writing, and keeps its prepared
+    # statements cached, which is why the commands bind their values with '?' instead of putting them in the SQL.
+
+    # Number of prepared statements each connection keeps
+    STATEMENT_CACHE_SIZE = 256
+
+    def __init__(self, database):
+        self.database = database
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # The connection is only ever used by the thread that made it, close_all() is the exception.
+            conn = sqlite3.connect(
+                self.database, cached_statements=Connections.STATEMENT_CACHE_SIZE, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Safe with WAL, a crash can only lose the last commits, not corrupt the database.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Deleting a preset deletes its bindings
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        # Closes the connection of the calling thread, e.g. before the thread ends.
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+        self.local.conn = None
+        with self.lock:
+            self.connections.remove(conn)
+        conn.close()
+
+    def close_all(self):
+        # Closes every thread's connection, called once when the app exits.
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+
+connections = Connections(db)
+
 
-    def open_db(self) -> None:
-        self.conn = sqlite3.connect(db)
-        self.cur = self.conn.cursor()
+class DBcmds:
+    # Holds all the methods needed to manipulate the database.
+    # Table and column names come from the database itself, values are always bound.
+
+    def get_conn(self) -> sqlite3.Connection:
+        ensure_setup()
+        return connections.get()
+
+    @contextmanager
+    def transaction(self):
+        # Commits when the block ends, or rolls back if it raises. A transaction opened inside another one
+        # is part of the outer one, so e.g. a migration made of several commands is written all at once.
+        conn = self.get_conn()
+        local = connections.local
+        if getattr(local, "in_transaction", False):
+            yield conn
+            return
+        local.in_transaction = True
+        try:
+            with conn:
+                # Opened explicitly, sqlite3 only opens one on its own before INSERT/UPDATE/DELETE,
+                # which would leave CREATE and ALTER TABLE out of it.
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                yield conn
+        finally:
+            local.in_transaction = False
+
+    def execute(self, stmt: str, params=()) -> sqlite3.Cursor:
+        # Runs one statement in its own transaction.
+        with self.transaction() as conn:
+            return conn.execute(stmt, params)
+
+    def write(self, key, stmt: str, rows: list, replaces=()) -> None:
+        # Runs a statement once per row of parameters, in one transaction.
+        # key names what it changes and replaces what it makes pointless, they're only used by a
+        # ConfigCache that holds its writes back (see config_writer.py), here the write is made right away.
+        self.write_many([(stmt, rows)])
+
+    def write_many(self, writes: list) -> None:
+        # Runs a list of (statement, rows of parameters) in one transaction.
+        with self.transaction() as conn:
+            for stmt, rows in writes:
+                conn.executemany(stmt, rows)
 
     def create_table(self, table_name: str, columns: dict) -> None:
-        self.open_db()
-        stmt = f"""CREATE TABLE IF NOT EXISTS {table_name}(Temp BOOLEAN)"""
-        self.cur.execute(stmt)
-
-        drop_temp_column = f"""ALTER TABLE {table_name} DROP COLUMN Temp"""
-        for k, v in columns.items():
-            add_columns = f"""
-            ALTER TABLE {table_name}
-            ADD {k} {v}
-            """
-            self.cur.execute(add_columns)
-
-        self.cur.execute(drop_temp_column)
-        self.conn.commit()
-        self.conn.close()
+        with self.transaction() as conn:
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}(Temp BOOLEAN)""")
+            for k, v in columns.items():
+                conn.execute(f"""ALTER TABLE {table_name} ADD {k} {v}""")
+            conn.execute(f"""ALTER TABLE {table_name} DROP COLUMN Temp""")
 
     def insert_data(self, table: str, data: list) -> None:
-        self.open_db()
         var_string = ', '.join('?' * len(data))
-        stmt = f"""INSERT INTO {table} VALUES (%s);""" % var_string
-        self.cur.execute(stmt, data)
-        self.conn.commit()
-        self.conn.close()
+        self.execute(f"""INSERT INTO {table} VALUES ({var_string})""", data)
 
     def update_data(self, table: str, column: str, data: any, row: int) -> None:
-        self.open_db()
-        stmt = f"""
-        UPDATE {table} SET {column} = {data} WHERE rowid = {row}
-        """
-        self.cur.execute(stmt)
-        self.conn.commit()
-        self.conn.close()
+        self.execute(f"""UPDATE {table} SET {column} = ? WHERE rowid = ?""", (data, row))
+
+    def update_rows(self, table: str, columns: list, rows: list) -> None:
+        # Sets the same columns of many rows in one transaction, rows is a list of (values, rowid)
+        # with a value for every column. Either every row is written or none is.
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        stmt = f"""UPDATE {table} SET {assignments} WHERE rowid = ?"""
+        key = ("rows", table, tuple(columns), tuple(int(row) for _, row in rows))
+        self.write(key, stmt, [(*values, row) for values, row in rows])
+
+    def update_row(self, table: str, data: dict, row: int) -> None:
+        # Sets several columns of a row at once, data is column name to value.
+        self.update_rows(table, list(data), [(list(data.values()), row)])
+
+    def add_column(self, table: str, column: str, column_type: str, default: any = None) -> None:
+        # Adds a column to an existing table, filling the rows that are already there with a default value.
+        with self.transaction() as conn:
+            conn.execute(f"""ALTER TABLE {table} ADD {column} {column_type}""")
+            if default is not None:
+                conn.execute(f"""UPDATE {table} SET {column} = ?""", (default,))
 
     def delete_table(self, table: str) -> None:
-        self.open_db()
-        stmt = f"DROP TABLE {table}"
-        self.cur.execute(stmt)
-        self.conn.commit()
-        self.conn.close()
+        self.execute(f"DROP TABLE {table}")
 
     def delete_row_data(self, table: str, row: int) -> None:
-        self.open_db()
-        stmt = f"DELETE FROM {table} WHERE rowid = {row}"
-        self.cur.execute(stmt)
-        self.conn.commit()
-        self.conn.close()
+        self.execute(f"DELETE FROM {table} WHERE rowid = ?", (row,))
 
     def delete_all_data(self, table: str) -> None:
-        self.open_db()
-        stmt = f"""DELETE FROM {table}"""
-        self.cur.execute(stmt)
-        self.conn.commit()
-        self.conn.close()
+        self.execute(f"""DELETE FROM {table}""")
 
     def get_all_data(self, table: str, get_row=False) -> list:
-        self.open_db()
         if get_row:
             stmt = f"SELECT rowid, * FROM {table}"
         else:
             stmt = f"SELECT * FROM {table}"
-        self.cur.execute(stmt)
-
-        data = self.cur.fetchall()
-        self.conn.close()
-
-        return data
+        return self.get_conn().execute(stmt).fetchall()
 
     def get_row_data(self, table: str, row: int) -> list:
-        self.open_db()
-        stmt = f"""SELECT * FROM {table} WHERE rowid = {row}"""
-        self.cur.execute(stmt)
-        raw_data = self.cur.fetchall()
-        data = raw_data[0]
-
-        self.conn.close()
-
-        return data
+        return self.get_conn().execute(f"""SELECT * FROM {table} WHERE rowid = ?""", (row,)).fetchone()
 
     def get_column(self, table: str) -> list:
         # gets column names of a table
-        self.open_db()
-        stmt = f"""PRAGMA table_info({table})"""
-        self.cur.execute(stmt)
-        columns = self.cur.fetchall()
-        names = [fields[1] for fields in columns]
-
-        self.conn.close()
-
-        return names
+        columns = self.get_conn().execute(f"""PRAGMA table_info({table})""").fetchall()
+        return [fields[1] for fields in columns]
 
 
 class TABLEcmds(DBcmds):
@@ -122,19 +185,54 @@ class TABLEcmds(DBcmds):
     DEFAULT_ENABLE_REPEAT = True
     DEFAULT_DELAY_PER_MOVEMENT = 0.1
     DEFAULT_REPEAT_SPEED = 0.03
+    DEFAULT_CURSOR_MODE = "repeat"  # one of CURSOR_MODES
+    DEFAULT_CURSOR_RATE = 120  # ticks per second of the analog cursor, one of cursor.CURSOR_RATES
+    CURSOR_MODES = ("repeat", "analog")
+
+    # Keybinds of PRESET_1 in a new database, in the order of the mapping columns.
+    # If you want a button to have no binds, then type 'Empty' on a field instead.
+    DEFAULT_MAPPING = [
+        'keyboard_pg_up',
+        'keyboard_pg_down',
+        'keyboard_pg_left',
+        'keyboard_pg_right',
+        'summon_keyboard',
+        'mouse_right_click',
+        'mouse_left_click',
+        'mouse_left_press',
+        'keyboard_ctrl_c',
+        'keyboard_alt_tab',
+        'keyboard_ctrl_a',
+        'mouse_move_up',
+        'mouse_move_down',
+        'mouse_move_left',
+        'mouse_move_right',
+        'keyboard_ctrl_v',
+        'keyboard_tab',
+        'keyboard_ctrl_x',
+        'mouse_scroll_up',
+        'mouse_scroll_down',
+        'Empty',
+        'Empty',
+        'keyboard_windows_btn',
+        'Empty',
+        'Empty'
+    ]
 
     def __init__(self):
         super().__init__()
         self.default_values = [
             TABLEcmds.DEFAULT_CURSOR_SPEED, TABLEcmds.DEFAULT_SCROLL_SPEED,
             TABLEcmds.DEFAULT_ENABLE_REPEAT, TABLEcmds.DEFAULT_DELAY_PER_MOVEMENT,
-            TABLEcmds.DEFAULT_REPEAT_SPEED
+            TABLEcmds.DEFAULT_REPEAT_SPEED, TABLEcmds.DEFAULT_CURSOR_MODE,
+            TABLEcmds.DEFAULT_CURSOR_RATE
         ]
 
     # Pre-made functions to reduce suffering in db operations and first time setup.
+    # create_mapping and create_presets make the tables of the original schema, normalize_bindings then turns
+    # them into the controls, presets and bindings tables. See MIGRATIONS.
     def create_mapping(self):
-        # Creates 3 columns, uses buttons as rows so that they can activate a given key.
-        # The function also creates a default set of keybinds at the first column. It cannot be edited on the app.
+        # Creates a column per control and a row per preset, the first row being the default set of keybinds.
         table_columns = {
             "DPAD_UP": "text",
             "DPAD_DOWN": "text",
@@ -162,48 +260,19 @@ class TABLEcmds(DBcmds):
             "START_BTN": "text",
             "ANALOG_BTN": "text"
         }
-        # NOTE: If you want a button to have no binds, then type 'Empty' on a field instead.
-        default_mapping = [
-            'keyboard_pg_up',
-            'keyboard_pg_down',
-            'keyboard_pg_left',
-            'keyboard_pg_right',
-            'summon_keyboard',
-            'mouse_right_click',
-            'mouse_left_click',
-            'mouse_left_press',
-            'keyboard_ctrl_c',
-            'keyboard_alt_tab',
-            'keyboard_ctrl_a',
-            'mouse_move_up',
-            'mouse_move_down',
-            'mouse_move_left',
-            'mouse_move_right',
-            'keyboard_ctrl_v',
-            'keyboard_tab',
-            'keyboard_ctrl_x',
-            'mouse_scroll_up',
-            'mouse_scroll_down',
-            'Empty',
-            'Empty',
-            'keyboard_windows_btn',
-            'Empty',
-            'Empty'
-        ]
-
         total_control_count = 25
         free_rows = []
         for _ in range(total_control_count):
             free_rows.append("Empty")
 
         self.create_table("mapping", table_columns)
-        self.insert_data("mapping", default_mapping)
+        self.insert_data("mapping", TABLEcmds.DEFAULT_MAPPING)
 
         for _ in range(2):
             self.insert_data("mapping", free_rows)
 
     def create_presets(self):
-        # creates presets, which can be activated/deactivated to run certain mapping columns
+        # creates presets, one boolean column each, which can be activated/deactivated to run certain mapping rows
         table_columns = {
             "PRESET_1": "BOOLEAN",
             "PRESET_2": "BOOLEAN",
@@ -247,14 +316,85 @@ class TABLEcmds(DBcmds):
         }
         self.create_table("all_keybinds", keybinds)
 
-    def set_keybinds_empty(self, row):
-        # changes all the values of mapping table to empty
-        table = "mapping"
-        columns = self.get_column("mapping")
-        keybind = "'Empty'"
-        for column in columns:
-            print(table, column, keybind, row)
-            self.update_data(table, column, keybind, row)
+    # Presets and their bindings, in the schema made by normalize_bindings.
+    # A preset is identified by its id, and a control without a row in bindings is 'Empty'.
+    def get_controls(self):
+        # Names of the controls, in the order they're shown and paired with a controller's events.
+        return tuple(name for (name,) in self.get_conn().execute("SELECT name FROM controls ORDER BY id"))
+
+    def get_presets(self):
+        # (id, name, active) of every preset
+        return tuple(self.get_conn().execute("SELECT id, name, active FROM presets ORDER BY id"))
+
+    def get_preset_names(self):
+        return tuple(name for _, name, _ in self.get_presets())
+
+    def get_preset_id(self, name):
+        for preset_id, preset_name, _ in self.get_presets():
+            if preset_name == name:
+                return preset_id
+        raise KeyError(f"No preset named {name!r}")
+
+    def get_mapping(self, preset_id):
+        # Keybinds of a preset, in the order of get_controls().
+        bindings = dict(self.get_conn().execute(
+            "SELECT control, action FROM bindings WHERE preset_id = ?", (preset_id,)))
+        return tuple(bindings.get(control, "Empty") for control in self.get_controls())
+
+    def set_binding(self, preset_id, control, action):
+        self.write(("binding", preset_id, control), UPSERT_BINDING, [(preset_id, control, action)])
+
+    def set_mapping(self, preset_id, keybinds):
+        # Replaces every keybind of a preset in one transaction, keybinds are in the order of get_controls().
+        controls = self.get_controls()
+        if len(keybinds) != len(controls):
+            raise ValueError(f"Expected {len(controls)} keybinds, got {len(keybinds)}")
+        log.debug("mapping_set", preset=preset_id, keybinds=keybinds)
+        self.write(("mapping", preset_id), UPSERT_BINDING,
+                   [(preset_id, control, action) for control, action in zip(controls, keybinds)],
+                   replaces=self.get_binding_keys(preset_id))
+
+    def set_keybinds_empty(self, preset_id):
+        # changes all the keybinds of a preset to empty
+        self.write(("empty", preset_id), "DELETE FROM bindings WHERE preset_id = ?", [(preset_id,)],
+                   replaces=self.get_binding_keys(preset_id))
+
+    def get_binding_keys(self, preset_id):
+        # Keys of the writes that set bindings of a preset, see write().
+        return [("binding", preset_id, control) for control in self.get_controls()] + \
+            [("mapping", preset_id), ("empty", preset_id)]
+
+    def activate_preset(self, preset):
+        # Turns a preset on and every other preset off, in one transaction.
+        self.write(("active",), "UPDATE presets SET active = (name = ?)", [(preset,)])
+
+    def create_preset(self, name):
+        # Adds a preset with nothing bound, returns its id.
+        return self.execute("INSERT INTO presets (name, active) VALUES (?, 0)", (name,)).lastrowid
+
+    def delete_preset(self, preset_id):
+        # Deletes a preset with its bindings, chords and combos.
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM chords WHERE preset = ?", (preset_id,))
+            conn.execute("DELETE FROM presets WHERE id = ?", (preset_id,))
+
+    def get_active_config(self):
+        # The config the engine needs, in the shape of a config_snapshot. Uses the first preset if none is enabled.
+        presets = self.get_presets()
+        if not presets:
+            return None
+        preset_id, preset, _ = next((row for row in presets if row[2]), presets[0])
+        controls = self.get_controls()
+        return {
+            "preset": preset,
+            "enabled": True,
+            "controls": list(controls),
+            "keybinds": dict(zip(controls, self.get_mapping(preset_id))),
+            "chords": [[trigger, keybind] for chord_preset, trigger, keybind in self.get_all_data("chords")
+                       if chord_preset == preset_id],
+            "macros": {name: steps for name, steps in self.get_all_data("macros")},
+            "tuning": list(self.get_all_data("tuning")[0])
+        }
 
     def create_tuning(self):
         # Creates adjustable tunings that can change the speed and feel of the controller when using the app.
@@ -263,40 +403,461 @@ class TABLEcmds(DBcmds):
             "scroll_speed": "INT",
             "enable_repeat": "BOOL",
             "delay_per_movement": "INT",
-            "repeat_speed": "INT"
+            "repeat_speed": "INT",
+            "cursor_mode": "TEXT",
+            "cursor_rate": "INT"
         }
 
         self.create_table("tuning", table_columns)
         self.insert_data("tuning", self.default_values)
 
-    def reset_tuning(self):
-        self.delete_all_data("tuning")
-        self.insert_data("tuning", self.default_values)
+    def upgrade_tuning(self):
+        # Databases made before the analog cursor existed don't have its tuning columns, so they're added here.
+        columns = self.get_column("tuning")
+        new_columns = {
+            "cursor_mode": ("TEXT", TABLEcmds.DEFAULT_CURSOR_MODE),
+            "cursor_rate": ("INT", TABLEcmds.DEFAULT_CURSOR_RATE)
+        }
+        for column, (column_type, default) in new_columns.items():
+            if column not in columns:
+                self.add_column("tuning", column, column_type, default)
+
+    def create_chords(self):
+        # Creates the chords (controls pressed together, "L1+CROSS") and combos (one after another,
+        # "DPAD_DOWN>SQUARE") of every preset, one per row. preset is the preset's id.
+        table_columns = {
+            "preset": "INT",
+            "controls": "TEXT",
+            "keybind": "TEXT"
+        }
+        self.create_table("chords", table_columns)
+
+    def save_chord(self, preset, controls, keybind):
+        # Binds a chord/combo of a preset, replacing the keybind it had.
+        self.delete_chord(preset, controls)
+        self.insert_data("chords", [preset, controls, keybind])
+
+    def delete_chord(self, preset, controls):
+        self.execute("DELETE FROM chords WHERE preset = ? AND controls = ?", (preset, controls))
 
-    def save_tuning(self, cursor_speed, scroll_speed, enable_repeat, delay_per_movement, repeat_speed):
-        self.delete_row_data("tuning", 1)
+    def create_macros(self):
+        # Creates the macros that can be bound as 'macro_<name>', see macros.py for how steps are written.
+        table_columns = {
+            "name": "TEXT",
+            "steps": "TEXT"
+        }
+        self.create_table("macros", table_columns)
+
+    def save_macro(self, name, steps):
+        # Saves a macro, replacing the one with the same name, and makes it a keybind that can be picked.
+        # Raises macros.MacroError if the macro doesn't compile.
+        macros.check_name(name)
+        macros.Macro(name, steps)
+        self.delete_macro(name)
+        self.insert_data("macros", [name, steps])
+        keybind = f"macro_{name}"
+        if keybind not in self.get_column("all_keybinds"):
+            self.add_column("all_keybinds", keybind, "NONE")
+
+    def delete_macro(self, name):
+        self.execute("DELETE FROM macros WHERE name = ?", (name,))
 
+    def reset_tuning(self):
+        # Saved like any other tuning, so a ConfigCache patches its copy and holds the write back.
+        self.save_tuning(*self.default_values)
+
+    def save_tuning(self, cursor_speed, scroll_speed, enable_repeat, delay_per_movement, repeat_speed,
+                    cursor_mode=DEFAULT_CURSOR_MODE, cursor_rate=DEFAULT_CURSOR_RATE):
+        # Updates the tuning row in place, so saving again before the last save is written replaces it.
+        # A cursor mode or rate the engine can't use raises ValueError before anything is saved.
+        if cursor_mode not in self.CURSOR_MODES:
+            raise ValueError(f"Cursor mode must be one of {self.CURSOR_MODES}, got {cursor_mode!r}")
+        if cursor_rate not in cursor.CURSOR_RATES:
+            raise ValueError(f"Cursor rate must be one of {cursor.CURSOR_RATES}, got {cursor_rate}")
         given_data = [cursor_speed, scroll_speed,
-                      enable_repeat, delay_per_movement, repeat_speed]
-        self.insert_data("tuning", given_data)
+                      enable_repeat, delay_per_movement, repeat_speed, cursor_mode, cursor_rate]
+        rows = self.get_all_data("tuning", get_row=True)
+        if not rows:
+            self.insert_data("tuning", given_data)
+            return
+        self.update_row("tuning", dict(zip(self.get_column("tuning"), given_data)), rows[0][0])
+
+
+    # Migrations, see MIGRATIONS
+    def create_original_schema(self):
+        # Version 1: the tables from before the database had a version. Databases made back then can be missing
+        # the ones that came later (chords, macros) and some tuning columns, so only what's missing is made.
+        creators = {
+            "mapping": self.create_mapping,
+            "presets": self.create_presets,
+            "all_keybinds": self.create_all_keybinds,
+            "tuning": self.create_tuning,
+            "chords": self.create_chords,
+            "macros": self.create_macros
+        }
+        for table, create in creators.items():
+            if not self.get_column(table):
+                create()
+        self.upgrade_tuning()
+
+    def normalize_bindings(self):
+        # Version 2: the mapping table (a column per control, a row per preset) and the presets table
+        # (a boolean column per preset) become one row per binding, so presets can be added without changing
+        # the schema and a binding is written without putting its column's name in the SQL.
+        # Preset ids are the old preset numbers, which the chords table already uses.
+        controls = self.get_column("mapping")
+        preset_names = self.get_column("presets")
+        preset_values = self.get_all_data("presets")[0]
+        mapping_rows = {row[0]: row[1:] for row in self.get_all_data("mapping", get_row=True)}
+
+        conn = self.get_conn()
+        conn.execute("DROP TABLE mapping")
+        conn.execute("DROP TABLE presets")
+        conn.execute("CREATE TABLE controls(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+        conn.execute("""
+            CREATE TABLE presets(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, active BOOLEAN NOT NULL DEFAULT 0)
+        """)
+        conn.execute("""
+            CREATE TABLE bindings(
+                preset_id INTEGER NOT NULL REFERENCES presets(id) ON DELETE CASCADE,
+                control TEXT NOT NULL,
+                action TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE UNIQUE INDEX bindings_preset_control ON bindings(preset_id, control)")
+        # For finding the bindings that use an action, e.g. a macro that's being deleted
+        conn.execute("CREATE INDEX bindings_action ON bindings(action)")
+
+        conn.executemany("INSERT INTO controls (name) VALUES (?)", [(control,) for control in controls])
+        presets = [(number, name, bool(value)) for number, (name, value) in enumerate(zip(preset_names, preset_values), 1)]
+        conn.executemany("INSERT INTO presets (id, name, active) VALUES (?, ?, ?)", presets)
+        for preset_id, _, _ in presets:
+            keybinds = mapping_rows.get(preset_id, ())
+            conn.executemany(
+                "INSERT INTO bindings (preset_id, control, action) VALUES (?, ?, ?)",
+                [(preset_id, control, action) for control, action in zip(controls, keybinds) if action is not None])
+
+
+UPSERT_BINDING = """
+    INSERT INTO bindings (preset_id, control, action) VALUES (?, ?, ?)
+    ON CONFLICT (preset_id, control) DO UPDATE SET action = excluded.action
+"""
+
+# Every change to the schema, in order. A database's version (PRAGMA user_version) is the number of them it has had.
+MIGRATIONS = (
+    TABLEcmds.create_original_schema,
+    TABLEcmds.normalize_bindings
+)
+
+class TableView:
+    # An immutable copy of a table. rows are tuples of values, like get_all_data() returns them.
+    __slots__ = ("columns", "rowids", "rows")
+
+    def __init__(self, columns, rowids, rows):
+        self.columns = columns
+        self.rowids = rowids
+        self.rows = rows
+
+    def get_row(self, row):
+        return self.rows[self.rowids.index(row)]
+
+    def with_updates(self, columns, rows):
+        # A copy with some columns of some rows changed, rows is a list of (values, rowid) like update_rows() takes.
+        indexes = [self.columns.index(column) for column in columns]
+        new_rows = list(self.rows)
+        for values, rowid in rows:
+            if rowid not in self.rowids:
+                continue
+            position = self.rowids.index(rowid)
+            new_row = list(new_rows[position])
+            for index, value in zip(indexes, values):
+                # Stored the way SQLite gives it back
+                new_row[index] = int(value) if isinstance(value, bool) else value
+            new_rows[position] = tuple(new_row)
+        return TableView(self.columns, self.rowids, tuple(new_rows))
+
+
+class ConfigCache(TABLEcmds):
+    # Keeps every table that's been read in memory, so the app and the engine can read the config as often
+    # as they like without going to the database.
+    # Reads return immutable tuples. Writes go to the database first, then the cached table is patched with
+    # what was written (updates) or dropped so it's read again next time (everything else).
+    # version goes up with every write, and the config_snapshot is written again if snapshot_path is set.
+    # The cache only sees the writes of its own process, the engine process gets its config from the GUI instead.
+    #
+    # After start_writer() the writes that patch the cache are made in the background (see config_writer.py),
+    # and so is the snapshot. The writes that drop a table first wait for the ones that are held back.
+
+    def __init__(self):
+        super().__init__()
+        self.tables = {}  # table name to TableView
+        self.mappings = {}  # preset id to the tuple get_mapping() returns
+        self.lock = threading.RLock()
+        self.version = 0
+        self.snapshot_path = None  # set by the process that owns the config, the app
+        self.writer = None  # a ConfigWriter once start_writer() is called
+
+    def get_view(self, table: str) -> TableView:
+        view = self.tables.get(table)
+        if view is None:
+            with self.lock:
+                view = self.tables.get(table)
+                if view is None:
+                    view = self.load(table)
+        return view
+
+    def load(self, table: str) -> TableView:
+        columns = tuple(super().get_column(table))
+        rows = super().get_all_data(table, get_row=True) if columns else []
+        view = TableView(columns, tuple(row[0] for row in rows), tuple(tuple(row[1:]) for row in rows))
+        self.tables[table] = view
+        return view
+
+    def invalidate(self, table: str = None) -> None:
+        # Drops a table from the cache, or every table if none is given.
+        with self.lock:
+            if table is None:
+                self.tables.clear()
+            else:
+                self.tables.pop(table, None)
+            if table in (None, "controls", "presets", "bindings"):
+                self.mappings.clear()
+            self.changed()
+
+    def changed(self):
+        # Called after every write, with the lock held.
+        self.version += 1
+        if self.snapshot_path is None:
+            return
+        if self.writer is not None:
+            self.writer.mark_changed()
+        else:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        with self.lock:
+            try:
+                config = self.get_active_config()
+            except sqlite3.Error as error:
+                # e.g. while the tables are being set up
+                log.warning("snapshot_skipped", error=str(error))
+                return
+            if config is not None:
+                config_snapshot.write(config, self.snapshot_path)
+
+    # Writing in the background
+    def start_writer(self, delay=config_writer.DEBOUNCE_DELAY):
+        with self.lock:
+            if self.writer is None:
+                self.writer = config_writer.ConfigWriter(self.write_many, self.after_write, delay)
+                self.writer.start()
+
+    def stop_writer(self):
+        # Writes whatever is held back and goes back to writing right away, called when the app exits.
+        writer = self.writer
+        if writer is None:
+            return
+        writer.stop()
+        with self.lock:
+            self.writer = None
+            # Anything written while it was stopping
+            writer.try_flush()
+
+    def flush(self):
+        # Waits for the writes that are held back, e.g. before a write that can't be held back.
+        # Called without the lock, the writer needs it to write the snapshot.
+        writer = self.writer
+        if writer is not None:
+            writer.flush()
+
+    def write(self, key, stmt: str, rows: list, replaces=()) -> None:
+        writer = self.writer
+        if writer is not None:
+            writer.put(key, stmt, rows, replaces)
+        else:
+            super().write(key, stmt, rows, replaces)
 
-def init_tables():
+    def after_write(self):
+        if self.snapshot_path is not None:
+            self.write_snapshot()
+
+    # Reads
+    def get_column(self, table: str) -> tuple:
+        return self.get_view(table).columns
+
+    def get_all_data(self, table: str, get_row=False) -> tuple:
+        view = self.get_view(table)
+        if get_row:
+            return tuple((rowid, *row) for rowid, row in zip(view.rowids, view.rows))
+        return view.rows
+
+    def get_row_data(self, table: str, row: int) -> tuple:
+        return self.get_view(table).get_row(int(row))
+
+    def get_controls(self):
+        return tuple(name for _, name in self.get_view("controls").rows)
+
+    def get_presets(self):
+        return self.get_view("presets").rows
+
+    def get_mapping(self, preset_id):
+        keybinds = self.mappings.get(preset_id)
+        if keybinds is None:
+            with self.lock:
+                keybinds = super().get_mapping(preset_id)
+                self.mappings[preset_id] = keybinds
+        return keybinds
+
+    # Writes that patch the cache. What they patch is read first, as the database won't have the write
+    # yet if it's held back.
+    def update_rows(self, table: str, columns: list, rows: list) -> None:
+        with self.lock:
+            view = self.get_view(table)
+            super().update_rows(table, columns, rows)
+            self.tables[table] = view.with_updates(columns, [(values, int(row)) for values, row in rows])
+            self.changed()
+
+    def update_data(self, table: str, column: str, data: any, row: int) -> None:
+        self.update_rows(table, [column], [([data], row)])
+
+    def set_binding(self, preset_id, control, action):
+        with self.lock:
+            keybinds = self.get_mapping(preset_id)
+            super().set_binding(preset_id, control, action)
+            index = self.get_controls().index(control)
+            self.mappings[preset_id] = keybinds[:index] + (action,) + keybinds[index + 1:]
+            self.changed()
+
+    def set_mapping(self, preset_id, keybinds):
+        with self.lock:
+            super().set_mapping(preset_id, keybinds)
+            self.mappings[preset_id] = tuple(keybinds)
+            self.changed()
+
+    def set_keybinds_empty(self, preset_id):
+        with self.lock:
+            super().set_keybinds_empty(preset_id)
+            self.mappings[preset_id] = ("Empty",) * len(self.get_controls())
+            self.changed()
+
+    def activate_preset(self, preset):
+        with self.lock:
+            view = self.get_view("presets")
+            super().activate_preset(preset)
+            self.tables["presets"] = view.with_updates(
+                ["active"], [((name == preset,), preset_id) for preset_id, name, _ in view.rows])
+            self.changed()
+
+    # Writes that drop the table from the cache
+    def create_table(self, table_name: str, columns: dict) -> None:
+        self.flush()
+        with self.lock:
+            super().create_table(table_name, columns)
+            self.invalidate(table_name)
+
+    def insert_data(self, table: str, data: list) -> None:
+        self.flush()
+        with self.lock:
+            super().insert_data(table, data)
+            self.invalidate(table)
+
+    def add_column(self, table: str, column: str, column_type: str, default: any = None) -> None:
+        self.flush()
+        with self.lock:
+            super().add_column(table, column, column_type, default)
+            self.invalidate(table)
+
+    def delete_table(self, table: str) -> None:
+        self.flush()
+        with self.lock:
+            super().delete_table(table)
+            self.invalidate(table)
+
+    def delete_row_data(self, table: str, row: int) -> None:
+        self.flush()
+        with self.lock:
+            super().delete_row_data(table, row)
+            self.invalidate(table)
+
+    def delete_all_data(self, table: str) -> None:
+        self.flush()
+        with self.lock:
+            super().delete_all_data(table)
+            self.invalidate(table)
+
+    def create_preset(self, name):
+        self.flush()
+        with self.lock:
+            preset_id = super().create_preset(name)
+            self.invalidate("presets")
+        return preset_id
+
+    def delete_preset(self, preset_id):
+        self.flush()
+        with self.lock:
+            super().delete_preset(preset_id)
+            self.invalidate("presets")
+            self.invalidate("chords")
+
+    def delete_chord(self, preset, controls):
+        self.flush()
+        with self.lock:
+            super().delete_chord(preset, controls)
+            self.invalidate("chords")
+
+    def delete_macro(self, name):
+        self.flush()
+        with self.lock:
+            super().delete_macro(name)
+            self.invalidate("macros")
+
+
+# The config of this process, read and written through by the app and the engine.
+config = ConfigCache()
+
+
+def migrate():
+    # Brings the database up to the latest version, every migration is one transaction.
+    # The commands a migration runs join its transaction instead of committing on their own.
     table_cmds = TABLEcmds()
-    table_cmds.create_mapping()
-    table_cmds.create_presets()
-    table_cmds.create_all_keybinds()
-    table_cmds.create_tuning()
+    version = table_cmds.get_conn().execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        log.info("db_migrating", path=db, version=number, name=migration.__name__)
+        with table_cmds.transaction() as conn:
+            migration(table_cmds)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+
+# Importing this module doesn't touch the database, it's set up the first time it's used (see ensure_setup()).
+setup_lock = threading.Lock()
+setup_thread = None  # ident of the thread setting the database up
+is_set_up = False
+
+
+def ensure_setup():
+    # Runs setup_table() once per process, before the first command. Other threads wait until it's done.
+    global setup_thread, is_set_up
+    if is_set_up or setup_thread == threading.get_ident():
+        return
+    with setup_lock:
+        if is_set_up:
+            return
+        setup_thread = threading.get_ident()
+        try:
+            setup_table()
+            is_set_up = True
+        finally:
+            setup_thread = None
+
 
 def setup_table():
-    # Checks if the database exists in the path, if it doesn't,
-    # it sets a new one up
-    files = os.listdir(db_path)
-    if db_name not in files:
-        print("Creating controls.db")
-        init_tables()
-        print("Finished making controls.db")
-    else:
-        print("controls.db already exists, setup aborted")
+    # Sets a new database up if there isn't one in the path, or upgrades the one that's there.
+    if db_name not in os.listdir(db_path):
+        log.info("db_creating", path=db)
+    migrate()
+    # Anything read before the tables were set up is read again.
+    config.invalidate()
+
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,87 @@
+# Keeps track of the controllers that are plugged in.
+# The engine adds and removes devices as SDL reports them, so the list is always up to date in memory
+# and anything interested (like the GUI) gets told when it changes instead of having to scan for controllers.
+
+import threading
+
+
+def get_device_id(key):
+    # Returns the instance id of the controller a key came from, or -1 if it's unknown.
+    try:
+        return key.joystick.get_id()
+    except AttributeError:
+        return -1
+
+
+class DeviceInfo:
+    # What's known about a controller, taken from pyjoystick's Joystick when it's added.
+
+    def __init__(self, joystick):
+        self.id = joystick.get_id()
+        self.name = joystick.get_name()
+        self.guid = getattr(joystick, "guid", "")
+        self.numbuttons = joystick.get_numbuttons()
+        self.numaxes = joystick.get_numaxes()
+        self.numhats = joystick.get_numhats()
+
+    def __repr__(self):
+        return f"<DeviceInfo {self.id}: {self.name}>"
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values):
+        # Makes a DeviceInfo without a joystick, e.g. from one that was sent by the engine's process.
+        info = cls.__new__(cls)
+        vars(info).update(values)
+        return info
+
+
+class DeviceRegistry:
+    # Listeners are called with ("added" or "removed", DeviceInfo) from the engine's thread,
+    # GUI listeners have to pass the change on to their own thread.
+
+    def __init__(self):
+        self.devices = {}  # device id to DeviceInfo
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            self.listeners.remove(listener)
+
+    def get_devices(self):
+        # Returns the connected controllers in the order they were given their ids.
+        with self.lock:
+            return [self.devices[device_id] for device_id in sorted(self.devices)]
+
+    def get(self, device_id):
+        return self.devices.get(device_id)
+
+    def add(self, joystick):
+        return self.add_info(DeviceInfo(joystick))
+
+    def add_info(self, info):
+        with self.lock:
+            self.devices[info.id] = info
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener("added", info)
+        return info
+
+    def remove(self, joystick):
+        return self.remove_id(joystick.get_id())
+
+    def remove_id(self, device_id):
+        with self.lock:
+            info = self.devices.pop(device_id, None)
+            listeners = list(self.listeners)
+        if info is not None:
+            for listener in listeners:
+                listener("removed", info)
+        return info
@@ -0,0 +1,373 @@
+# Runs the engine in its own process instead of a thread of the GUI.
+# The engine then doesn't share the GIL with Qt, so a busy GUI (repopulating tables, open dialogs...) can't
+# hold up controller input, and input keeps working if the GUI crashes.
+#
+# The GUI writes the config the engine should use (keybinds, chords, macros and tuning) into a shared memory
+# block, and the engine checks it for a new version a few times a second. The block works like a seqlock:
+# its sequence number is odd while the GUI is writing, so the engine never reads a half-written config.
+# The engine sends its status (the connected controllers, the config version it's using) back over a local
+# connection. Its port and key are kept in the block too, so a restarted GUI can find an engine that's still running.
+#
+# Until the GUI has written a config, the engine uses the one in the config_snapshot, so input works as soon
+# as the engine is up.
+#
+# The GUI uses it through EngineClient, run the app with --engine-process to turn it on.
+# It can also be started on its own with: python engine_process.py
+
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import config_snapshot
+import devices
+import logger
+
+CONFIG_NAME = "controller_for_windows_config"
+CONFIG_SIZE = 256 * 1024
+# sequence number, port of the engine, key of the engine, length of the config
+HEADER = struct.Struct("<QI32sI")
+# Seconds between checks for a new config
+CONFIG_POLL = 0.05
+# Seconds the GUI waits for a new engine process to be ready
+START_TIMEOUT = 10.0
+
+
+class SharedConfig:
+    # The shared memory block. The GUI is the only one that writes the config, the engine the only one
+    # that writes its address.
+
+    def __init__(self, create=False):
+        if create:
+            try:
+                self.memory = shared_memory.SharedMemory(CONFIG_NAME, create=True, size=CONFIG_SIZE)
+            except FileExistsError:
+                # Left behind by an engine that didn't exit cleanly, it's reused.
+                self.memory = self.attach()
+        else:
+            self.memory = self.attach()
+        self.buffer = self.memory.buf
+
+    @staticmethod
+    def attach():
+        # Raises FileNotFoundError if there's no block.
+        memory = shared_memory.SharedMemory(CONFIG_NAME)
+        if os.name == "posix":
+            # Python removes every block a process attached to once it exits, which would pull the block
+            # out from under the engine when the GUI closes.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+    def close(self, unlink=False):
+        self.buffer.release()
+        self.memory.close()
+        if unlink:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+    def get_sequence(self):
+        return struct.unpack_from("<Q", self.buffer)[0]
+
+    def get_address(self):
+        _, port, key, _ = HEADER.unpack_from(self.buffer)
+        return port, key
+
+    def set_address(self, port, key):
+        sequence, _, _, length = HEADER.unpack_from(self.buffer)
+        HEADER.pack_into(self.buffer, 0, sequence, port, key, length)
+
+    def write(self, config):
+        payload = json.dumps(config).encode()
+        if len(payload) > CONFIG_SIZE - HEADER.size:
+            raise ValueError(f"Config is too big for shared memory ({len(payload)} bytes)")
+
+        sequence, port, key, _ = HEADER.unpack_from(self.buffer)
+        sequence += sequence % 2
+        struct.pack_into("<Q", self.buffer, 0, sequence + 1)
+        self.buffer[HEADER.size:HEADER.size + len(payload)] = payload
+        HEADER.pack_into(self.buffer, 0, sequence + 2, port, key, len(payload))
+        return sequence + 2
+
+    def read(self):
+        # Returns (sequence number, config), the config is None if nothing has been written yet.
+        while True:
+            sequence, _, _, length = HEADER.unpack_from(self.buffer)
+            if sequence % 2:
+                # Being written
+                time.sleep(0.001)
+                continue
+            payload = bytes(self.buffer[HEADER.size:HEADER.size + length])
+            if self.get_sequence() == sequence:
+                return sequence, json.loads(payload) if length else None
+
+
+def apply_config(engine, config):
+    # Sets up a ShardedEngine with a config written by EngineClient, or loaded from a config_snapshot.
+    engine.get_tuning_data(config["tuning"])
+    engine.update_event_repeater()
+    engine.update_cursor()
+    engine.update_macros(config["macros"])
+    engine.set_chords([tuple(chord) for chord in config["chords"]])
+    engine.keybinds = config["keybinds"]
+    if config["enabled"]:
+        engine.enable()
+    else:
+        engine.disable()
+
+
+class EngineServer:
+    # The engine's side, runs a ShardedEngine with whatever config is in the block.
+
+    def __init__(self):
+        import mapping
+        import shards
+
+        self.config = SharedConfig(create=True)
+        key = os.urandom(32)
+        self.listener = Listener(("localhost", 0), authkey=key)
+        self.config.set_address(self.listener.address[1], key)
+
+        snapshot = config_snapshot.load()
+        if snapshot is not None:
+            controls = dict(zip(snapshot["controls"], mapping.definitions))
+            self.engine = shards.ShardedEngine(None, controls, tuning_values=snapshot["tuning"])
+            apply_config(self.engine, snapshot)
+        else:
+            self.engine = shards.ShardedEngine(None, mapping.Controls().get())
+        self.engine.devices.subscribe(lambda change, device: self.send_devices())
+        self.version = 0
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self._is_running = True
+
+    def apply(self, config):
+        apply_config(self.engine, config)
+
+    def send(self, message):
+        with self.send_lock:
+            if self.connection is None:
+                return
+            try:
+                self.connection.send(message)
+            except OSError:
+                # The GUI is gone, input keeps going with the config it last wrote.
+                self.connection = None
+
+    def send_devices(self):
+        self.send(("devices", [info.to_dict() for info in self.engine.devices.get_devices()]))
+
+    def serve(self):
+        # Takes one GUI at a time, a new one replaces the last.
+        while self._is_running:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            with self.send_lock:
+                self.connection = connection
+            self.send_devices()
+            self.send(("applied", self.version))
+            threading.Thread(target=self.receive, args=(connection,), daemon=True).start()
+
+    def receive(self, connection):
+        while self._is_running:
+            try:
+                message = connection.recv()
+            except (OSError, EOFError):
+                return
+            if message[0] == "stop":
+                self._is_running = False
+                return
+
+    def run(self):
+        self.engine.start()
+        threading.Thread(target=self.serve, name="EngineServer", daemon=True).start()
+        while self._is_running:
+            sequence = self.config.get_sequence()
+            if sequence != self.version and not sequence % 2:
+                sequence, config = self.config.read()
+                if config is not None:
+                    self.apply(config)
+                self.version = sequence
+                self.send(("applied", sequence))
+            time.sleep(CONFIG_POLL)
+        self.stop()
+
+    def stop(self):
+        self._is_running = False
+        self.engine.stop()
+        self.listener.close()
+        self.config.close(unlink=True)
+
+
+class EngineClient:
+    # The GUI's side. Has the same methods the app uses on a ShardedEngine, every change is written to the block.
+
+    def __init__(self, controls_dict):
+        import mapping
+        self.mapping = mapping
+
+        self.controls = controls_dict
+        self.devices = devices.DeviceRegistry()  # kept up to date by the engine
+        self.shared = None
+        self.connection = None
+        self.process = None
+        self.applied_version = 0  # config version the engine is using
+        self.lock = threading.Lock()
+        self.config = {
+            "enabled": True,
+            "keybinds": {},
+            "chords": [],
+            "macros": {},
+            "tuning": []
+        }
+        snapshot = config_snapshot.load()
+        if snapshot is not None:
+            # The engine starts with the snapshot, so the first config written shouldn't undo it.
+            for name in self.config:
+                self.config[name] = snapshot[name]
+            self.cursor_mode = snapshot["tuning"][5]
+            self.cursor_rate = snapshot["tuning"][6]
+        else:
+            self.get_tuning_data(publish=False)
+            self.update_macros(publish=False)
+
+    @property
+    def keybinds(self):
+        return self.config["keybinds"]
+
+    @keybinds.setter
+    def keybinds(self, keybinds_dict):
+        self.config["keybinds"] = dict(keybinds_dict) if keybinds_dict is not None else {}
+        self.publish()
+
+    def enable(self):
+        self.config["enabled"] = True
+        self.publish()
+
+    def disable(self):
+        self.config["enabled"] = False
+        self.publish()
+
+    def set_chords(self, chord_binds):
+        self.config["chords"] = [list(chord) for chord in chord_binds]
+        self.publish()
+
+    def update_macros(self, publish=True):
+        self.config["macros"] = self.mapping.Macros().get()
+        if publish:
+            self.publish()
+
+    def get_tuning_data(self, publish=True):
+        tuning_values = list(self.mapping.db_cmds.get_all_data("tuning")[0])
+        self.cursor_mode = tuning_values[5]
+        self.cursor_rate = tuning_values[6]
+        self.config["tuning"] = tuning_values
+        if publish:
+            self.publish()
+
+    def update_event_repeater(self):
+        # The engine applies the whole tuning with every config, so there's nothing else to send.
+        pass
+
+    def update_cursor(self):
+        pass
+
+    def publish(self):
+        # Writes the config, returns its version or None if the engine isn't started yet.
+        with self.lock:
+            if self.shared is None:
+                return None
+            return self.shared.write(self.config)
+
+    def connect(self):
+        port, key = self.shared.get_address()
+        if not port:
+            raise ConnectionRefusedError("The engine hasn't started listening yet")
+        return Client(("localhost", port), authkey=key)
+
+    def start(self):
+        # Connects to the engine that's already running (e.g. after the GUI crashed), or starts a new one.
+        try:
+            self.shared = SharedConfig()
+            self.connection = self.connect()
+        except (OSError, EOFError, AuthenticationError):
+            self.connection = self.start_process()
+
+        threading.Thread(target=self.receive, name="EngineClient", daemon=True).start()
+        self.publish()
+
+    def start_process(self):
+        old_address = self.shared.get_address() if self.shared is not None else None
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)])
+
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(CONFIG_POLL)
+            try:
+                if self.shared is None:
+                    self.shared = SharedConfig()
+                if self.shared.get_address() == old_address:
+                    continue
+                return self.connect()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+        raise TimeoutError("The engine process didn't start")
+
+    def receive(self):
+        while True:
+            try:
+                message = self.connection.recv()
+            except (OSError, EOFError):
+                return
+            match message[0]:
+                case "devices":
+                    self.update_devices(message[1])
+                case "applied":
+                    self.applied_version = message[1]
+
+    def update_devices(self, device_dicts):
+        infos = {values["id"]: values for values in device_dicts}
+        for info in self.devices.get_devices():
+            if info.id not in infos:
+                self.devices.remove_id(info.id)
+        for device_id, values in infos.items():
+            if self.devices.get(device_id) is None:
+                self.devices.add_info(devices.DeviceInfo.from_dict(values))
+
+    def stop(self):
+        # Stops the engine process, it keeps running if the GUI exits without calling this.
+        if self.connection is not None:
+            try:
+                self.connection.send(("stop",))
+            except OSError:
+                pass
+            self.connection.close()
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=START_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.shared is not None:
+            self.shared.close()
+
+
+if __name__ == "__main__":
+    import startup
+    profiler = startup.StartupProfiler()
+    logger.start_writer(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "engine.log"))
+    try:
+        server = EngineServer()
+        profiler.mark("engine")
+        profiler.report()
+        server.run()
+    finally:
+        logger.stop_writer()
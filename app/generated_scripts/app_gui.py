@@ -43,20 +43,20 @@ class Ui_MainWindow(object):
         self.controller_refresh_btn.setGeometry(QtCore.QRect(171, 280, 91, 31))
         self.controller_refresh_btn.setObjectName("controller_refresh_btn")
         self.action_delay_grp = QtWidgets.QGroupBox(parent=self.controllers_tab)
-        self.action_delay_grp.setGeometry(QtCore.QRect(290, 10, 281, 301))
+        self.action_delay_grp.setGeometry(QtCore.QRect(290, 10, 281, 331))
         self.action_delay_grp.setObjectName("action_delay_grp")
         self.repeat_chkbox = QtWidgets.QCheckBox(parent=self.action_delay_grp)
-        self.repeat_chkbox.setGeometry(QtCore.QRect(5, 110, 131, 21))
+        self.repeat_chkbox.setGeometry(QtCore.QRect(5, 140, 131, 21))
         self.repeat_chkbox.setLayoutDirection(QtCore.Qt.LayoutDirection.RightToLeft)
         self.repeat_chkbox.setAutoFillBackground(False)
         self.repeat_chkbox.setChecked(True)
         self.repeat_chkbox.setObjectName("repeat_chkbox")
         self.delay_activation_lbl = QtWidgets.QLabel(parent=self.action_delay_grp)
-        self.delay_activation_lbl.setGeometry(QtCore.QRect(10, 160, 121, 16))
+        self.delay_activation_lbl.setGeometry(QtCore.QRect(10, 190, 121, 16))
         self.delay_activation_lbl.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeading|QtCore.Qt.AlignmentFlag.AlignLeft|QtCore.Qt.AlignmentFlag.AlignVCenter)
         self.delay_activation_lbl.setObjectName("delay_activation_lbl")
         self.delay_activation_slider = QtWidgets.QSlider(parent=self.action_delay_grp)
-        self.delay_activation_slider.setGeometry(QtCore.QRect(10, 180, 191, 21))
+        self.delay_activation_slider.setGeometry(QtCore.QRect(10, 210, 191, 21))
         self.delay_activation_slider.setMinimum(1)
         self.delay_activation_slider.setMaximum(10)
         self.delay_activation_slider.setPageStep(1)
@@ -68,11 +68,11 @@ class Ui_MainWindow(object):
         self.delay_activation_slider.setTickInterval(1)
         self.delay_activation_slider.setObjectName("delay_activation_slider")
         self.repeat_speed_lbl = QtWidgets.QLabel(parent=self.action_delay_grp)
-        self.repeat_speed_lbl.setGeometry(QtCore.QRect(10, 210, 111, 21))
+        self.repeat_speed_lbl.setGeometry(QtCore.QRect(10, 240, 111, 21))
         self.repeat_speed_lbl.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeading|QtCore.Qt.AlignmentFlag.AlignLeft|QtCore.Qt.AlignmentFlag.AlignVCenter)
         self.repeat_speed_lbl.setObjectName("repeat_speed_lbl")
         self.repeat_speed_slider = QtWidgets.QSlider(parent=self.action_delay_grp)
-        self.repeat_speed_slider.setGeometry(QtCore.QRect(10, 230, 191, 21))
+        self.repeat_speed_slider.setGeometry(QtCore.QRect(10, 260, 191, 21))
         self.repeat_speed_slider.setMinimum(1)
         self.repeat_speed_slider.setMaximum(10)
         self.repeat_speed_slider.setPageStep(1)
@@ -84,24 +84,24 @@ class Ui_MainWindow(object):
         self.repeat_speed_slider.setTickInterval(1)
         self.repeat_speed_slider.setObjectName("repeat_speed_slider")
         self.delay_activation_input = QtWidgets.QDoubleSpinBox(parent=self.action_delay_grp)
-        self.delay_activation_input.setGeometry(QtCore.QRect(220, 180, 51, 22))
+        self.delay_activation_input.setGeometry(QtCore.QRect(220, 210, 51, 22))
         self.delay_activation_input.setDecimals(2)
         self.delay_activation_input.setMinimum(0.1)
         self.delay_activation_input.setMaximum(1.0)
         self.delay_activation_input.setSingleStep(0.1)
         self.delay_activation_input.setObjectName("delay_activation_input")
         self.repeat_speed_input = QtWidgets.QDoubleSpinBox(parent=self.action_delay_grp)
-        self.repeat_speed_input.setGeometry(QtCore.QRect(220, 230, 51, 22))
+        self.repeat_speed_input.setGeometry(QtCore.QRect(220, 260, 51, 22))
         self.repeat_speed_input.setMinimum(0.01)
         self.repeat_speed_input.setMaximum(0.1)
         self.repeat_speed_input.setSingleStep(0.01)
         self.repeat_speed_input.setProperty("value", 0.03)
         self.repeat_speed_input.setObjectName("repeat_speed_input")
         self.reset_tune_btn = QtWidgets.QPushButton(parent=self.action_delay_grp)
-        self.reset_tune_btn.setGeometry(QtCore.QRect(10, 260, 101, 31))
+        self.reset_tune_btn.setGeometry(QtCore.QRect(10, 290, 101, 31))
         self.reset_tune_btn.setObjectName("reset_tune_btn")
         self.save_tune_btn = QtWidgets.QPushButton(parent=self.action_delay_grp)
-        self.save_tune_btn.setGeometry(QtCore.QRect(110, 260, 161, 31))
+        self.save_tune_btn.setGeometry(QtCore.QRect(110, 290, 161, 31))
         self.save_tune_btn.setObjectName("save_tune_btn")
         self.cursor_speed_input = QtWidgets.QSpinBox(parent=self.action_delay_grp)
         self.cursor_speed_input.setGeometry(QtCore.QRect(220, 30, 51, 22))
@@ -146,11 +146,26 @@ class Ui_MainWindow(object):
         self.cursor_speed_lbl.setGeometry(QtCore.QRect(10, 30, 81, 20))
         self.cursor_speed_lbl.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeading|QtCore.Qt.AlignmentFlag.AlignLeft|QtCore.Qt.AlignmentFlag.AlignVCenter)
         self.cursor_speed_lbl.setObjectName("cursor_speed_lbl")
+        self.cursor_mode_lbl = QtWidgets.QLabel(parent=self.action_delay_grp)
+        self.cursor_mode_lbl.setGeometry(QtCore.QRect(10, 110, 81, 20))
+        self.cursor_mode_lbl.setAlignment(QtCore.Qt.AlignmentFlag.AlignLeading|QtCore.Qt.AlignmentFlag.AlignLeft|QtCore.Qt.AlignmentFlag.AlignVCenter)
+        self.cursor_mode_lbl.setObjectName("cursor_mode_lbl")
+        self.cursor_mode_list = QtWidgets.QComboBox(parent=self.action_delay_grp)
+        self.cursor_mode_list.setGeometry(QtCore.QRect(100, 110, 81, 22))
+        self.cursor_mode_list.setObjectName("cursor_mode_list")
+        self.cursor_mode_list.addItem("")
+        self.cursor_mode_list.addItem("")
+        self.cursor_rate_list = QtWidgets.QComboBox(parent=self.action_delay_grp)
+        self.cursor_rate_list.setGeometry(QtCore.QRect(190, 110, 81, 22))
+        self.cursor_rate_list.setObjectName("cursor_rate_list")
+        self.cursor_rate_list.addItem("")
+        self.cursor_rate_list.addItem("")
+        self.cursor_rate_list.addItem("")
         self.launch_keyboard_grp = QtWidgets.QGroupBox(parent=self.controllers_tab)
-        self.launch_keyboard_grp.setGeometry(QtCore.QRect(290, 320, 281, 80))
+        self.launch_keyboard_grp.setGeometry(QtCore.QRect(290, 350, 281, 60))
         self.launch_keyboard_grp.setObjectName("launch_keyboard_grp")
         self.launch_keyboard_btn = QtWidgets.QPushButton(parent=self.launch_keyboard_grp)
-        self.launch_keyboard_btn.setGeometry(QtCore.QRect(10, 30, 261, 31))
+        self.launch_keyboard_btn.setGeometry(QtCore.QRect(10, 20, 261, 31))
         self.launch_keyboard_btn.setObjectName("launch_keyboard_btn")
         self.tabWidget.addTab(self.controllers_tab, "")
         self.mapping_tab = QtWidgets.QWidget()
@@ -271,6 +286,12 @@ class Ui_MainWindow(object):
         self.save_tune_btn.setText(_translate("MainWindow", "Save"))
         self.scroll_speed_lbl.setText(_translate("MainWindow", "Scroll Speed:"))
         self.cursor_speed_lbl.setText(_translate("MainWindow", "Cursor Speed:"))
+        self.cursor_mode_lbl.setText(_translate("MainWindow", "Cursor Mode:"))
+        self.cursor_mode_list.setItemText(0, _translate("MainWindow", "Repeat"))
+        self.cursor_mode_list.setItemText(1, _translate("MainWindow", "Analog"))
+        self.cursor_rate_list.setItemText(0, _translate("MainWindow", "60 Hz"))
+        self.cursor_rate_list.setItemText(1, _translate("MainWindow", "120 Hz"))
+        self.cursor_rate_list.setItemText(2, _translate("MainWindow", "240 Hz"))
         self.launch_keyboard_grp.setTitle(_translate("MainWindow", "Launch Keyboard"))
         self.launch_keyboard_btn.setText(_translate("MainWindow", "Launch Keyboard Widget"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.controllers_tab), _translate("MainWindow", "Controllers"))
@@ -0,0 +1,149 @@
+# Structured logging for the app and the engine.
+# A log call records an event name with some fields, e.g. log.info("keybind_set", control="L1", row=2).
+# Records go into a preallocated ring of recent events, and a background thread writes them to a file as JSON lines,
+# so logging never waits on the disk or the console.
+# A call below the current level returns right away, so debug logging can stay in busy code.
+
+import json
+import queue
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Number of recent records kept in memory
+RING_SIZE = 1024
+
+
+class LogHub:
+    # Shared by every Logger. Records are (time, level, logger name, event, fields) tuples.
+
+    def __init__(self, level=INFO, ring_size=RING_SIZE):
+        self.level = level
+        self.ring = [None] * ring_size
+        self.count = 0
+        self.lock = threading.Lock()
+        self.records = queue.SimpleQueue()  # records waiting for the writer
+        self.writer = None
+        self.writing = False
+        self.path = None
+
+    def emit(self, record):
+        with self.lock:
+            self.ring[self.count % len(self.ring)] = record
+            self.count += 1
+            if self.writing:
+                self.records.put(record)
+
+    def get_recent(self, amount=None):
+        # Returns the most recent records, oldest first.
+        with self.lock:
+            size = len(self.ring)
+            count = self.count
+            start = max(0, count - size)
+            if amount is not None:
+                start = max(start, count - amount)
+            return [self.ring[index % size] for index in range(start, count)]
+
+    def start_writer(self, path):
+        # Starts writing records to a file, beginning with the ones still in the ring.
+        if self.writer is not None:
+            return
+        self.path = path
+        with self.lock:
+            size = len(self.ring)
+            for index in range(max(0, self.count - size), self.count):
+                self.records.put(self.ring[index % size])
+            self.writing = True
+        self.writer = threading.Thread(target=self.write_records, name="LogWriter", daemon=True)
+        self.writer.start()
+
+    def stop_writer(self):
+        # Writes whatever is left and stops the writer.
+        writer = self.writer
+        if writer is None:
+            return
+        with self.lock:
+            self.writing = False
+            self.records.put(None)
+        self.writer = None
+        writer.join()
+
+    def write_records(self):
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                record = self.records.get()
+                if record is None:
+                    break
+                file.write(format_record(record))
+                if self.records.empty():
+                    file.flush()
+
+
+def format_record(record):
+    timestamp, level, name, event, fields = record
+    line = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}",
+        "level": LEVEL_NAMES.get(level, str(level)),
+        "logger": name,
+        "event": event
+    }
+    line.update(fields)
+    return json.dumps(line, default=str) + "\n"
+
+
+class Logger:
+    def __init__(self, name, hub):
+        self.name = name
+        self.hub = hub
+
+    def is_enabled(self, level):
+        # For guarding log calls whose fields are expensive to work out.
+        return level >= self.hub.level
+
+    def debug(self, event, **fields):
+        if DEBUG < self.hub.level:
+            return
+        self.hub.emit((time.time(), DEBUG, self.name, event, fields))
+
+    def info(self, event, **fields):
+        if INFO < self.hub.level:
+            return
+        self.hub.emit((time.time(), INFO, self.name, event, fields))
+
+    def warning(self, event, **fields):
+        if WARNING < self.hub.level:
+            return
+        self.hub.emit((time.time(), WARNING, self.name, event, fields))
+
+    def error(self, event, **fields):
+        if ERROR < self.hub.level:
+            return
+        self.hub.emit((time.time(), ERROR, self.name, event, fields))
+
+
+hub = LogHub()
+
+
+def get_logger(name):
+    return Logger(name, hub)
+
+
+def set_level(level):
+    hub.level = level
+
+
+def start_writer(path):
+    hub.start_writer(path)
+
+
+def stop_writer():
+    hub.stop_writer()
+
+
+def get_recent(amount=None):
+    return hub.get_recent(amount)
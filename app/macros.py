@@ -0,0 +1,121 @@
+# Macros are keybinds that run a sequence of keyboard and mouse actions, with waits in between.
+# They're written as steps separated by ';', e.g. "key_down alt; send tab; wait 200; key_up alt"
+#
+# Steps:
+#   send, key_down, key_up <hotkey>    presses/releases a hotkey (keyboard library names, e.g. 'ctrl+c')
+#   click, press <button>              'left', 'right' or 'middle'
+#   wheel <delta>                      scrolls, negative is down
+#   move_to <x> <y>                    moves the cursor to a point on the screen
+#   wait <milliseconds>
+#
+# A macro is compiled once into a timeline of (seconds from the start, batch of action tuples), where every
+# batch is the actions between two waits so they can be handed to backend.submit() together.
+
+import re
+import logger
+
+STEP_ARGS = {
+    "send": (str,),
+    "key_down": (str,),
+    "key_up": (str,),
+    "click": (str,),
+    "press": (str,),
+    "wheel": (int,),
+    "move_to": (int, int)
+}
+
+# Keybinds that used to be hardcoded in ActionGenerator, the names are kept so that saved presets still work.
+BUILTIN_MACROS = {
+    # Holds alt+tab down until keyboard_tab lets go of it, so tab can be used to pick a window.
+    "keyboard_alt_tab": "key_down alt+tab",
+    "keyboard_tab": "send tab; key_up alt+tab",
+    # The start menu doesn't always open if the windows key is pressed right as the button is.
+    "keyboard_windows_btn": "wait 150; send cmd"
+}
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+
+log = logger.get_logger("macros")
+
+
+class MacroError(ValueError):
+    pass
+
+
+def check_name(name):
+    # Macro names end up as column names in the all_keybinds table, so only letters, numbers and '_' are allowed.
+    if not NAME_PATTERN.match(name):
+        raise MacroError(f"invalid macro name: {name!r}")
+
+
+def parse_step(step):
+    # Returns ("wait", seconds) or an action tuple like ("send", "ctrl+c").
+    name, _, rest = step.strip().partition(" ")
+    rest = rest.strip()
+    if name == "wait":
+        try:
+            return "wait", float(rest) / 1000
+        except ValueError:
+            raise MacroError(f"invalid wait: {step!r}") from None
+
+    arg_types = STEP_ARGS.get(name)
+    if arg_types is None:
+        raise MacroError(f"unknown macro step: {step!r}")
+    if arg_types == (str,):
+        args = [rest] if rest else []
+    else:
+        args = rest.split()
+    if len(args) != len(arg_types):
+        raise MacroError(f"wrong number of arguments: {step!r}")
+    try:
+        return (name, *[arg_type(arg) for arg_type, arg in zip(arg_types, args)])
+    except ValueError:
+        raise MacroError(f"invalid argument: {step!r}") from None
+
+
+class Macro:
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+        self.timeline = compile_steps(steps)
+        self.duration = self.timeline[-1][0] if self.timeline else 0.0
+
+    def __repr__(self):
+        return f"<Macro {self.name}: {self.steps}>"
+
+
+def compile_steps(steps):
+    timeline = []
+    offset = 0.0
+    batch = []
+    for step in steps.split(";"):
+        if not step.strip():
+            continue
+        action = parse_step(step)
+        if action[0] == "wait":
+            if batch:
+                timeline.append((offset, tuple(batch)))
+                batch = []
+            offset += action[1]
+        else:
+            batch.append(action)
+    if batch:
+        timeline.append((offset, tuple(batch)))
+    return timeline
+
+
+def compile_macros(macro_steps):
+    # Compiles a dictionary of macro name to steps into one of keybind to Macro, saved macros are bound
+    # as 'macro_<name>' and the built-in macros under their own keybind.
+    # Macros that don't compile are left out, their keybinds then do nothing.
+    keybind_steps = dict(BUILTIN_MACROS)
+    for name, steps in macro_steps.items():
+        keybind_steps[f"macro_{name}"] = steps
+
+    compiled = {}
+    for name, steps in keybind_steps.items():
+        try:
+            compiled[name] = Macro(name, steps)
+        except MacroError as error:
+            log.warning("macro_skipped", macro=name, error=str(error))
+    return compiled
@@ -5,11 +5,21 @@
 from pyjoystick.sdl2 import run_event_loop
 
 import pyjoystick
-import keyboard  # NOTE: This one is used for keyboard commands, this program uses a seperate keyboard for typing
+import itertools
 import threading
 import time
+from functools import partial
+from types import MappingProxyType
 import db_setup as setup
-import mouse
+import logger
+import axis_filters
+import backends
+import chords
+import cursor
+import macros
+import metrics
+import output_queue
+import repeat_scheduler
 
 # list of controller events
 definitions = [
@@ -18,18 +28,21 @@ definitions = [
     "-Axis 4", "Axis 4", "-Axis 2", "Axis 2", "Button 8"
 ]
 
-setup.setup_table()
-db_cmds = setup.DBcmds()
+db_cmds = setup.config
+log = logger.get_logger("engine")
 
 
 class Controls:
     def __init__(self) -> None:
-        self.controls_data = db_cmds.get_column("mapping")
+        self.controls_data = db_cmds.get_controls()
 
-    def get(self):
+    def get(self, device_definitions=None):
         # Turns raw controller input into a more readable and user-friendly format
+        # Controllers with a different layout can pass their own list of controller events.
+        if device_definitions is None:
+            device_definitions = definitions
         controls_dict = {}
-        for column, control in zip(self.controls_data, definitions):
+        for column, control in zip(self.controls_data, device_definitions):
             controls_dict[column] = control
         return controls_dict
 
@@ -37,16 +50,13 @@ class Controls:
 class Keybinds:
     def __init__(self):
         # Pairs controls and keybinds together according to the preset enabled by the user
-        self.keybind_data = db_cmds.get_all_data("mapping")
+        self.preset_data = db_cmds.get_presets()
 
     def return_match(self, presets_dict):
-        # Returns a combination of keybinds and the preset that is enabled
-        if presets_dict["PRESET_1"] == True:
-            return self.keybind_data[0], "PRESET_1"
-        elif presets_dict["PRESET_2"] == True:
-            return self.keybind_data[1], "PRESET_2"
-        elif presets_dict["PRESET_3"] == True:
-            return self.keybind_data[2], "PRESET_3"
+        # Returns a combination of keybinds and the preset that is enabled, None if no preset is
+        for preset_id, preset, _ in self.preset_data:
+            if presets_dict.get(preset):
+                return db_cmds.get_mapping(preset_id), preset
 
     def bind(self, controls_dict, correct_keybinds):
         # creates a dictionary where a control is a key and a keybind is a value
@@ -56,216 +66,577 @@ class Keybinds:
         return keybinds_dict
 
 
+class Chords:
+    def __init__(self):
+        # Grabs the chords and combos of every preset
+        self.chord_data = db_cmds.get_all_data("chords")
+
+    def get(self, preset):
+        # Returns the (controls, keybind) pairs of a preset, e.g. ("L1+CROSS", "keyboard_alt_f4")
+        return [(controls, keybind) for preset_num, controls, keybind in self.chord_data if preset_num == preset]
+
+
+class Macros:
+    def __init__(self):
+        # Grabs the saved macros
+        self.macro_data = db_cmds.get_all_data("macros")
+
+    def get(self):
+        # Returns a dictionary of macro name to its steps
+        return {name: steps for name, steps in self.macro_data}
+
+
 class Presets:
     def __init__(self) -> None:
         # Grabs presets and their values (True or False) for further use
-        self.presets = db_cmds.get_column("presets")
-        self.preset_data = db_cmds.get_all_data("presets")
-        # Removes double encapsulation
-        self.preset_values = self.preset_data[0]
+        self.preset_data = db_cmds.get_presets()
         self.presets_dict = {}
 
     def get(self):
         # Gets the presets and their values and returns it as a dictionary.
-        for preset, preset_value in zip(self.presets, self.preset_values):
+        for _, preset, preset_value in self.preset_data:
             self.presets_dict[preset] = preset_value
         return self.presets_dict
 
 
+class BindingSnapshot:
+    # A compiled preset. A snapshot is never changed once it's made, a new one replaces it with a single assignment,
+    # so the input thread always sees the whole old preset or the whole new one and never a mix of both.
+    # version goes up with every snapshot, compile_time is how long the preset took to compile, in seconds.
+    __slots__ = ("version", "enabled", "keybinds", "dispatch", "actions", "chords", "cursor_axes", "compile_time")
+
+    def __init__(self, version, enabled, keybinds, dispatch, actions, chords, cursor_axes, compile_time=0.0):
+        self.version = version
+        self.enabled = enabled
+        self.keybinds = keybinds  # read-only, None if no preset was given
+        self.dispatch = dispatch
+        self.actions = actions
+        self.chords = chords
+        self.cursor_axes = cursor_axes
+        self.compile_time = compile_time
+
+    def __repr__(self):
+        state = "enabled" if self.enabled else "disabled"
+        return f"<BindingSnapshot {self.version} {state}, {len(self.dispatch)} keys>"
+
+    def with_enabled(self, version, enabled):
+        # The same preset turned on or off, nothing has to be compiled again.
+        return BindingSnapshot(version, enabled, self.keybinds, self.dispatch, self.actions, self.chords,
+                               self.cursor_axes)
+
+
+class OutputThreads:
+    # Where actions go out: the output worker that runs them, the virtual cursor that keeps the cursor position
+    # and the analog cursor. An ActionGenerator makes its own, a ShardedEngine makes one for all of its shards,
+    # since two virtual cursors would each move the one cursor from the position they last knew.
+
+    def __init__(self, backend, rate, action_queue=None):
+        if action_queue is None:
+            action_queue = output_queue.ActionQueue()
+        # Runs the actions on its own thread so OS calls never hold up the controller input.
+        self.output = output_queue.OutputWorker(action_queue)
+        # Tracks the cursor position so that moves don't have to ask the OS where the cursor is.
+        self.virtual_cursor = cursor.VirtualCursor(
+            get_position=backend.get_position, move_to=backend.move_to, rate=rate)
+        # Analog cursor, only used when cursor_mode is "analog". Every ActionGenerator adds its sticks as a
+        # source, after they're filtered, so it doesn't need a deadzone of its own.
+        self.cursor = cursor.AnalogCursor(
+            read_axis=None, move_by=self.virtual_cursor.move_by, speed=0.0, rate=rate, deadzone=0.0)
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self.output.start()
+        self.virtual_cursor.start()
+        self.cursor.start()
+
+    def stop(self):
+        self.cursor.stop()
+        self.virtual_cursor.stop()
+        self.output.stop()
+        if self.output.is_alive() and self.output is not threading.current_thread():
+            self.output.join()
+
+    def set_backend(self, backend):
+        self.virtual_cursor.get_position = backend.get_position
+        self.virtual_cursor.move_to = backend.move_to
+
+
 class ActionGenerator(threading.Thread):
-    def __init__(self, keybinds_dict, controls_dict):
+    def __init__(self, keybinds_dict, controls_dict, backend=None, event_manager=None, action_queue=None,
+                 tuning_values=None, macro_steps=None, output_threads=None):
         # This generates mouse/keyboard movement through careful interpretation of controller data.
         # It only stops as soon as the application/program is closed.
+        # The backend is what actually sends the movement, by default it's sent to the OS.
+        # event_manager replaces pyjoystick's manager as the source of controller keys (e.g. a replay).
+        # action_queue is the output_queue.ActionQueue (size and overflow policy) between input and output.
+        # tuning_values replaces the saved tuning, see get_tuning_data(), and macro_steps the saved macros.
+        # output_threads are shared OutputThreads, whoever made them starts and stops them. The generator still
+        # has a queue of its own on their worker, so it's the only one putting actions into it.
         threading.Thread.__init__(self)
-        self.keybinds = keybinds_dict
+        if backend is None:
+            backend = backends.InputLibBackend()
+        self.owns_output = output_threads is None
+        self.output_threads = output_threads
+        self.output_backend = backend
+        self.backend = backend
+        self.mngr = event_manager
+        self.recorder = None  # set to a recorder.InputRecorder to record every key that's received, see below
+        self.metrics = None  # see enable_metrics()
         self.controls = controls_dict
-        self.movement = []
-        self.tuning_data = self.get_tuning_data()
+        self.chord_binds = []  # (controls, keybind) pairs, see set_chords()
+        # The compiled preset that's in use, see the keybinds setter.
+        self.versions = itertools.count()
+        self.bindings = BindingSnapshot(next(self.versions), True, None, {}, {}, chords.ChordMatcher({}), ())
+        self.bindings_lock = threading.Lock()  # taken by whoever makes a new snapshot, the input thread never takes it
+        self.tuning_data = self.get_tuning_data(tuning_values)
+        if macro_steps is None:
+            macro_steps = Macros().get()
+        self.macros = macros.compile_macros(macro_steps)  # keybind to macros.Macro
+
+        if self.owns_output:
+            self.output_threads = OutputThreads(backend, self.cursor_rate, action_queue)
+            self.action_queue = self.output_threads.output.queue
+        else:
+            self.action_queue = action_queue if action_queue is not None else output_queue.ActionQueue()
+            self.output_threads.output.add_queue(self.action_queue)
+        self.output = self.output_threads.output
+        self.virtual_cursor = self.output_threads.virtual_cursor
+        self.cursor = self.output_threads.cursor
+        # Smooths the sticks and applies their deadzones, see set_axis_settings().
+        self.axis_filter = axis_filters.AxisFilter(read_raw=self.read_axis)
+        # The analog cursor reads this generator's sticks after they're filtered.
+        self.cursor.add_source(self, self.axis_filter.get, self.axis_filter.process)
+        self.cursor.speed = self.get_analog_speed()
+        self.keybinds = keybinds_dict
+
+        # Repeats held controls, it's handed to the event manager as its button_repeater.
+        self.repeater = repeat_scheduler.RepeatScheduler(
+            delay=self.delay_per_movement, interval=self.repeat_speed, enabled=self.enable_repeat)
 
         self._is_running = True
         self.daemon = True
 
     def toggle_event_repeater(self, repeater):
-        if self.enable_repeat:
-            repeater.first_repeat_timeout = self.delay_per_movement
-            repeater.check_timeout = self.repeat_speed
-        elif not self.enable_repeat:
-            repeater.first_repeat_timeout = None
-            repeater.check_timeout = None
+        # Turns repeating on or off according to the tuning.
+        repeater.configure(self.delay_per_movement, self.repeat_speed, enabled=bool(self.enable_repeat))
 
     def update_event_repeater(self):
-        self.repeater.first_repeat_timeout = self.delay_per_movement
-        self.repeater.check_timeout = self.repeat_speed
+        self.toggle_event_repeater(self.repeater)
 
-    def get_tuning_data(self):
-        tuning_data = db_cmds.get_all_data("tuning")
-        tuning_values = tuning_data[0]
+    def set_repeat(self, control, delay, interval, acceleration=1.0, min_interval=None):
+        # Gives a single control its own repeat timing instead of delay_per_movement/repeat_speed.
+        # An acceleration below 1 makes the repeats speed up the longer the control is held, down to min_interval.
+        # A delay of None stops the control from repeating.
+        settings = repeat_scheduler.RepeatSettings(delay, interval, acceleration, min_interval)
+        self.repeater.set_key_settings(self.controls[control], settings)
+
+    def reset_repeat(self, control):
+        # Makes a control use the tuning's repeat timing again.
+        self.repeater.set_key_settings(self.controls[control], None)
+
+    def set_axis_settings(self, number, settings):
+        # Gives an axis its own deadzone, smoothing and response curve (an axis_filters.AxisSettings).
+        self.axis_filter.set_settings(number, settings)
+
+    def get_tuning_data(self, tuning_values=None):
+        # The tuning can be given as a row of the tuning table instead of being read from it,
+        # e.g. when the engine runs in its own process and gets it from the GUI.
+        if tuning_values is None:
+            tuning_data = db_cmds.get_all_data("tuning")
+            tuning_values = tuning_data[0]
         self.cursor_speed = tuning_values[0]
         self.scroll_speed = tuning_values[1]
         self.enable_repeat = tuning_values[2]
         self.delay_per_movement = tuning_values[3]
         self.repeat_speed = tuning_values[4]
+        self.cursor_mode = tuning_values[5]
+        self.cursor_rate = tuning_values[6]
+
+    def update_macros(self, macro_steps=None):
+        # Compiles the saved macros again, e.g. after one was added or changed.
+        # macro_steps (macro name to steps) replaces the saved macros, like tuning_values does for the tuning.
+        if macro_steps is None:
+            macro_steps = Macros().get()
+        self.macros = macros.compile_macros(macro_steps)
+        self.keybinds = self.keybinds
+
+    def get_analog_speed(self):
+        # With the stick pushed all the way, the analog cursor is as fast as a held stick in repeat mode.
+        if self.repeat_speed <= 0:
+            return self.cursor_speed / setup.TABLEcmds.DEFAULT_REPEAT_SPEED
+        return self.cursor_speed / self.repeat_speed
+
+    def update_cursor(self):
+        # Applies the cursor tuning. The preset is compiled again because mouse_move binds
+        # on the sticks are handled by the analog cursor instead of the dispatch table in analog mode.
+        self.cursor.speed = self.get_analog_speed()
+        self.cursor.set_rate(self.cursor_rate)
+        self.virtual_cursor.set_rate(self.cursor_rate)
+        self.keybinds = self.keybinds
+
+    def read_axis(self, number):
+        # Returns the value of an axis from the connected controllers, the one pushed the furthest wins.
+        value = 0.0
+        for joystick in self.mngr.joysticks:
+            try:
+                axis_value = joystick.get_axis(number)
+            except IndexError:
+                continue
+            if abs(axis_value) > abs(value):
+                value = axis_value
+        return value
 
     def run(self):
         # NOTE: thread actually starts here.
         # This keeps the thread alive so that it can continously capture controller input.
-        self.set_event_manager()
+        if self.mngr is None:
+            self.set_event_manager()
+        else:
+            self.mngr.start()
+        if self.owns_output:
+            self.output_threads.start()
         while self._is_running:
-            self.find_key()
+            if self.metrics is None:
+                self.find_key()
+            else:
+                self.find_key_metered()
+
+    def stop(self):
+        self._is_running = False
+        self.cursor.remove_source(self)
+        if self.owns_output:
+            self.output_threads.stop()
+        else:
+            # The worker runs what's left in the queue and then lets it go.
+            self.action_queue.close()
+        self.mngr.stop()
+
+    def queue_stats(self):
+        # Depth and drop/coalesce counts of the queue between the input and output threads,
+        # and how many actions failed on the output worker.
+        return dict(self.action_queue.stats(), errors=self.output.errors)
 
     def set_event_manager(self):
-        # This sets pyjoystick's ThreadEventManager that has the ability to record same input for a
-        # set amount of time.
-
-        # clearer explanation of timeouts:
-        # first_repeat_timeout: more like timeout activation
-        # repeat_timeout: delay of a repeat of events
-        # check_timeout: prevents action from happening for too long
-        self.repeater = pyjoystick.Repeater(
-            first_repeat_timeout=self.delay_per_movement, repeat_timeout=self.repeat_speed, check_timeout=0.01)
-
-        self.toggle_event_repeater(self.repeater)
+        # This sets pyjoystick's ThreadEventManager, with the repeat scheduler so that held controls
+        # keep sending events.
 
+        # clearer explanation of timings:
+        # delay_per_movement: how long a control is held before it starts repeating
+        # repeat_speed: delay between every repeat after that
         self.mngr = pyjoystick.ThreadEventManager(event_loop=run_event_loop,
                                                   button_repeater=self.repeater)
         self.mngr.start()
 
     def find_key(self):
         # Records controller input.
-        key = self.mngr.find_key(timeout=float('inf'))
+        key = self.mngr.find_key(timeout=self.get_key_timeout())
         if key:
+            if self.key_recorder is not None:
+                self.key_recorder.write(key)
             self.handle_key_event(key)
+        else:
+            self.bindings.chords.expire_if_due()
+
+    def get_key_timeout(self):
+        # Controller input is waited on forever, unless a chord/combo has been started and has to be
+        # given up on once its time runs out.
+        timeout = self.bindings.chords.get_timeout()
+        if timeout is None:
+            return float('inf')
+        return timeout
+
+    def find_key_metered(self):
+        # Same as find_key and handle_key_event, but times every stage of the event.
+        metrics = self.metrics
+        start = time.perf_counter()
+        key = self.mngr.find_key(timeout=self.get_key_timeout())
+        found = time.perf_counter()
+        metrics.add("wait", found - start)
+        if not key:
+            self.bindings.chords.expire_if_due()
+            return
+
+        if self.key_recorder is not None:
+            self.key_recorder.write(key)
+        metrics.count("events")
+        bindings = self.bindings
+        if not bindings.enabled:
+            metrics.count("dropped_keys")
+            return
+
+        if bindings.chords.pending or key.is_repeat and bindings.chords.root.children:
+            bindings.chords.press(str(key), key.is_repeat)
+            metrics.add("lookup", time.perf_counter() - found)
+            return
+
+        action = bindings.dispatch.get(str(key))
+        looked_up = time.perf_counter()
+        metrics.add("lookup", looked_up - found)
+        if action is None:
+            metrics.count("invalid_keys")
+            return
+
+        if not action():
+            # The output queue was full, the action or an older one was dropped
+            metrics.count("dropped_keys")
+        metrics.add("resolve", time.perf_counter() - looked_up)
+
+    def enable_metrics(self, engine_metrics=None):
+        # Starts timing every stage of the engine, the metrics can then be read from self.metrics.
+        if engine_metrics is None:
+            engine_metrics = metrics.EngineMetrics()
+        self.set_backend(metrics.MeteredBackend(self.output_backend, engine_metrics))
+        self.metrics = engine_metrics
+        return engine_metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+        self.set_backend(self.output_backend)
+
+    def set_backend(self, backend):
+        # Swaps the backend that actions are sent to, the preset is compiled again so that it uses it.
+        self.backend = backend
+        self.output_threads.set_backend(backend)
+        self.keybinds = self.keybinds
+
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        # An event manager that filters the sticks' keys (a shard's DeviceEventSource) records the keys itself,
+        # before they're filtered, so the recording has the controller's own values. Otherwise they're recorded
+        # here as they arrive.
+        self._recorder = recorder
+        if hasattr(self.mngr, "recorder"):
+            self.mngr.recorder = recorder
+            self.key_recorder = None
+        else:
+            self.key_recorder = recorder
+
+    @property
+    def keybinds(self):
+        return self.bindings.keybinds
+
+    @keybinds.setter
+    def keybinds(self, keybinds_dict):
+        # The preset is compiled as soon as it is assigned, so the work of matching controls
+        # and parsing keybind strings happens once per preset instead of once per event.
+        # It's compiled into a new snapshot on the caller's thread, then swapped in between two events.
+        # Whether the controls are enabled stays the same, see enable()/disable().
+        start = time.perf_counter()
+        if keybinds_dict is not None:
+            keybinds_dict = MappingProxyType(dict(keybinds_dict))
+        with self.bindings_lock:
+            dispatch, actions, matcher, cursor_axes = self.compile_dispatch(keybinds_dict)
+            compile_time = time.perf_counter() - start
+            self.publish(BindingSnapshot(next(self.versions), self.bindings.enabled, keybinds_dict, dispatch,
+                                         actions, matcher, tuple(cursor_axes), compile_time))
+        if self.metrics is not None:
+            self.metrics.add("swap", compile_time)
+
+    def enable(self):
+        # Turns the controls on, with the preset that was last set.
+        with self.bindings_lock:
+            self.publish(self.bindings.with_enabled(next(self.versions), True))
+
+    def disable(self):
+        # Turns the controls off. Keys are ignored until enable() is called, the preset is kept.
+        with self.bindings_lock:
+            self.publish(self.bindings.with_enabled(next(self.versions), False))
+
+    def publish(self, bindings):
+        # Swaps in a snapshot, the analog cursor follows it.
+        self.bindings = bindings
+        self.cursor.set_axes(list(bindings.cursor_axes) if bindings.enabled else [], self)
+
+    def set_chords(self, chord_binds):
+        # Sets the chords and combos of the preset, as (controls, keybind) pairs.
+        # Controls pressed together are joined by '+' (e.g. "L1+CROSS"), one after another by '>'.
+        self.chord_binds = list(chord_binds)
+        self.keybinds = self.keybinds
+
+    def compile_dispatch(self, keybinds_dict):
+        # Creates a dictionary where a raw controller key (e.g. "-Axis 1") is paired with a prebuilt action.
+        # Every entry hands its action to the output worker, which runs it off the input thread.
+        # Controls with no keybind, or with an 'Empty' one, are left out so they're simply ignored.
+        # Returns (dispatch, actions, chord matcher, cursor axes), actions has the same actions without the hand-off.
+        actions = {}
+        dispatch = {}
+        cursor_axes = []
+        if not keybinds_dict:
+            return dispatch, actions, chords.ChordMatcher({}), cursor_axes
+
+        for control, key in self.controls.items():
+            movement = keybinds_dict.get(control)
+            if movement is None:
+                continue
+            if self.cursor_mode == "analog" and self.add_cursor_axis(cursor_axes, key, movement):
+                continue
+            action = self.compile_action(movement)
+            if action is not None:
+                actions[key] = action
+                dispatch[key] = partial(self.action_queue.put, action)
+
+        matcher = self.compile_chords(dispatch)
+        # Keys that can start a chord/combo go through the matcher first, every other key stays a single lookup.
+        for key in matcher.get_starting_keys():
+            dispatch[key] = partial(matcher.press, key)
+        return dispatch, actions, matcher, cursor_axes
+
+    def compile_chords(self, singles):
+        # Compiles the chords and combos of the preset, the ones with an unknown control or no action are left out.
+        matcher = chords.ChordMatcher(dict(singles))
+        for trigger, movement in self.chord_binds:
+            controls, is_chord = chords.parse_trigger(trigger)
+            keys = [self.controls.get(control) for control in controls]
+            if None in keys or len(keys) < 2:
+                continue
+            action = self.compile_action(movement)
+            if action is not None:
+                matcher.add(keys, partial(self.action_queue.put, action), is_chord)
+        return matcher
+
+    def add_cursor_axis(self, cursor_axes, key, movement):
+        # Hands a mouse_move bind on a stick to the analog cursor. Returns False if the bind isn't one,
+        # e.g. mouse_move_up on the D-pad, so that it can still be compiled like any other action.
+        if not movement.startswith("mouse_move_"):
+            return False
+        axis = cursor.parse_axis(key)
+        if axis is None:
+            return False
+
+        number, sign = axis
+        direction_x, direction_y = cursor.MOVE_DIRECTIONS[movement.split("_")[2]]
+        cursor_axes.append((number, sign, direction_x, direction_y))
+        return True
+
+    def compile_action(self, movement):
+        # Restructures readable keybind format into a callable that generates the movement.
+        # Returns None if the keybind doesn't do anything (like 'Empty').
+        macro = self.macros.get(movement)
+        if macro is not None:
+            return partial(self.run_macro, macro)
 
-    def handle_key_event(self, key):
-        # Recieves the controller events and assigns them to their corresponding keybinds
-        # If none are received, or an invalid key is pressed, it will receive other controller input
-        # instead.
-        for k, v in self.controls.items():
-            if key == v:
-                assigned_key = k
-
-        try:
-            if assigned_key in self.keybinds.keys():
-                self.movement = self.keybinds[assigned_key]
-                print(assigned_key, self.movement)
-                self.restructure_params(self.movement)
-        except UnboundLocalError:
-            print("Invalid key pressed")
-        except AttributeError:
-            print("Keybind dictionary might be empty or is disabled")
-
-    def restructure_params(self, movement):
-        # Restructures readable keybind format into something easier to compare for movement.
         params = movement.split("_")
         input_type = params[0]
 
         match input_type:
             case "mouse":
                 if params[1] == "scroll" or params[1] == "move":
-                    self.generate_mouse_action(
-                        direction=params[2], action=params[1])
-                    
-                elif params[2] == "press":
-                    self.generate_mouse_action(
-                        direction=params[1], action=params[2]
-                    )
-                
-                elif params[2] == "click":
-                    self.generate_mouse_action(
-                        direction=params[1], action=params[2])
-            
+                    return partial(self.generate_mouse_action, direction=params[2], action=params[1])
+
+                elif params[2] == "press" or params[2] == "click":
+                    return partial(self.generate_mouse_action, direction=params[1], action=params[2])
+
             case "keyboard":
-                params.pop(0)  # removes input_type
-                self.generate_keyboard_action(params)
-            
+                # removes input_type
+                return partial(self.generate_keyboard_action, params[1:])
+
             case "summon":
                 if params[1] == "keyboard":
-                    keyboard.press_and_release("ctrl+k")
+                    return partial(self.backend.send, "ctrl+k")
 
-    def generate_mouse_action(self, direction, action):
-        mouse_pos = mouse.get_position()
-        pos_x = mouse_pos[0]
-        pos_y = mouse_pos[1]
+        return None
 
+    def handle_key_event(self, key):
+        # Recieves the controller events and runs their corresponding keybinds.
+        # Invalid keys and unbound controls have no entry in the dispatch table, so they are skipped.
+        # The snapshot is read once, so a preset that's swapped in halfway through doesn't affect this key.
+        bindings = self.bindings
+        if not bindings.enabled:
+            return
+        if bindings.chords.pending or key.is_repeat and bindings.chords.root.children:
+            # The rest of a chord/combo might be coming, the matcher decides what the key does.
+            # Repeats go there too, so a repeat of a key that can start one doesn't start one.
+            bindings.chords.press(str(key), key.is_repeat)
+            return
+        action = bindings.dispatch.get(str(key))
+        if action is not None:
+            action()
+        elif log.is_enabled(logger.DEBUG):
+            # Checked first so the key isn't formatted when debug logging is off.
+            log.debug("unbound_key", key=str(key))
+
+    def run_macro(self, macro):
+        # Runs on the output worker. Every batch is scheduled from the same starting time,
+        # so the waits of a long macro don't drift, and the first batch is sent right away.
+        start = time.monotonic()
+        for offset, batch in macro.timeline:
+            if offset <= 0:
+                self.backend.submit(batch)
+            else:
+                self.output.schedule_at(start + offset, partial(self.backend.submit, batch))
+
+    def generate_mouse_action(self, direction, action):
         if action == "move":
+            # The move is sent on the virtual cursor's next tick, together with any other
+            # direction that's held at the same time.
             match direction:
                 case "up":
-                    new_pos_y = pos_y - self.cursor_speed
-                    mouse.move(pos_x, new_pos_y)
+                    self.virtual_cursor.nudge(0, -self.cursor_speed)
                 case "down":
-                    new_pos_y = pos_y + self.cursor_speed
-                    mouse.move(pos_x, new_pos_y)
+                    self.virtual_cursor.nudge(0, self.cursor_speed)
                 case "left":
-                    new_pos_x = pos_x - self.cursor_speed
-                    mouse.move(new_pos_x, pos_y)
+                    self.virtual_cursor.nudge(-self.cursor_speed, 0)
                 case "right":
-                    new_pos_x = pos_x + self.cursor_speed
-                    mouse.move(new_pos_x, pos_y)
+                    self.virtual_cursor.nudge(self.cursor_speed, 0)
 
         elif action == "click":
-            if direction == "right":
-                # Reason for this line is because pressing right-click to open a menu is not enough,
-                # you also have to release the key.
-                mouse.right_click()
-            else:
-                # The 'direction' variable is understood by the mouse method as either 'left', or 'right'
-                # Therefore no need to individually map their logic 
-                #mouse.click(direction)
-                mouse.click(direction)
+            # The 'direction' variable is understood by the backend as either 'left', 'right' or 'middle'
+            # Therefore no need to individually map their logic.
+            # A click also releases the button, which is needed for right-click menus to open.
+            self.backend.click(direction)
 
         elif action == "press":
-            mouse.press(direction)
+            self.backend.press(direction)
 
         elif action == "scroll":
             match direction:
                 case "up":
-                    mouse.wheel(self.scroll_speed)
+                    self.backend.wheel(self.scroll_speed)
                 case "down":
-                    mouse.wheel(-self.scroll_speed)
+                    self.backend.wheel(-self.scroll_speed)
 
     def generate_keyboard_action(self, key):
         match key[0]:
             case "esc":
-                keyboard.press_and_release("esc")
-            case "tab":
-                keyboard.press_and_release("tab")
-                keyboard.release("alt+tab")
+                self.backend.send("esc")
             case "shift":
-                keyboard.press_and_release("shift")
+                self.backend.send("shift")
             case "f11":
-                keyboard.press_and_release("f11")
-            case "windows":
-                time.sleep(0.15)
-                keyboard.press_and_release("cmd")
+                self.backend.send("f11")
 
         # alt keys
         if key[0] == "alt":
             match key[1]:
                 case "f4":
-                    keyboard.press_and_release("alt+f4")
-                case "tab":
-                    keyboard.press("alt+tab")
+                    self.backend.send("alt+f4")
 
         # ctrl keys
         if key[0] == "ctrl":
             match key[1]:
                 case "c":
-                    keyboard.press_and_release("ctrl+c")
+                    self.backend.send("ctrl+c")
                 case "v":
-                    keyboard.press_and_release("ctrl+v")
+                    self.backend.send("ctrl+v")
                 case "x":
-                    keyboard.press_and_release("ctrl+x")
+                    self.backend.send("ctrl+x")
                 case "a":
-                    keyboard.press_and_release("ctrl+a")
+                    self.backend.send("ctrl+a")
 
         # pg keys
         if key[0] == "pg":
             match key[1]:
                 case "up":
-                    keyboard.press_and_release("up")
+                    self.backend.send("up")
                 case "down":
-                    keyboard.press_and_release("down")
+                    self.backend.send("down")
                 case "left":
-                    keyboard.press_and_release("left")
+                    self.backend.send("left")
                 case "right":
-                    keyboard.press_and_release("right")
+                    self.backend.send("right")
@@ -0,0 +1,128 @@
+# Counters and timings for the stages of the engine, so it's possible to tell where time goes.
+# Timings are kept in preallocated ring buffers, recording one is just a couple of array writes.
+# When metrics are disabled the engine doesn't touch any of this.
+
+# Stages of an event:
+#   wait: waiting for the event manager to hand out a key
+#   lookup: finding the key's action in the dispatch table
+#   resolve: handing the action over to the output worker
+#   backend: the backend call itself (moving the mouse, pressing keys...), on the output/cursor threads
+#   swap: compiling a preset into a new snapshot when it's set (not part of an event)
+# Dropped keys are keys received while controls are disabled, or that didn't fit in the output queue.
+
+from array import array
+
+import os
+import threading
+import time
+
+STAGES = ("wait", "lookup", "resolve", "backend", "swap")
+COUNTERS = ("events", "invalid_keys", "dropped_keys")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class EngineMetrics:
+    # NOTE: Samples can come from more than one thread (e.g. the cursor threads call the backend),
+    # so under heavy load a sample can occasionally be overwritten. That's fine for metrics.
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.samples = {stage: array("d", bytes(8 * size)) for stage in STAGES}
+        self.sample_counts = {stage: 0 for stage in STAGES}
+        self.counters = {name: 0 for name in COUNTERS}
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def add(self, stage, seconds):
+        count = self.sample_counts[stage]
+        self.samples[stage][count % self.size] = seconds
+        self.sample_counts[stage] = count + 1
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        for stage in STAGES:
+            self.sample_counts[stage] = 0
+        for name in self.counters:
+            self.counters[name] = 0
+
+    def get_stage(self, stage):
+        # Returns the number of samples, and the quantiles/max (in seconds) of the ones still in the ring buffer.
+        count = self.sample_counts[stage]
+        ordered = sorted(self.samples[stage][:min(count, self.size)])
+        stats = {"count": count}
+        for quantile in QUANTILES:
+            stats[quantile] = ordered[int(quantile * (len(ordered) - 1))] if ordered else 0.0
+        stats["max"] = ordered[-1] if ordered else 0.0
+        return stats
+
+    def snapshot(self):
+        return {
+            "stages": {stage: self.get_stage(stage) for stage in STAGES},
+            "counters": dict(self.counters)
+        }
+
+    def to_prometheus(self):
+        # Formats the metrics in Prometheus' text exposition format.
+        lines = [
+            "# HELP controller_stage_seconds Time spent in each stage of the input engine.",
+            "# TYPE controller_stage_seconds summary"
+        ]
+        for stage in STAGES:
+            stats = self.get_stage(stage)
+            for quantile in QUANTILES:
+                lines.append(f'controller_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {stats[quantile]:.9f}')
+            lines.append(f'controller_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE controller_{name}_total counter")
+            lines.append(f"controller_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        # Writes to a temporary file first so that readers never see a half-written file.
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    def start_dumping(self, path, interval=5.0):
+        # Dumps the metrics to a file every few seconds on a background thread.
+        self.stop_dumping()
+        self._dump_stop.clear()
+
+        def dump_loop():
+            while not self._dump_stop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+
+        self._dump_thread = threading.Thread(target=dump_loop, daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self):
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+
+class MeteredBackend:
+    # Wraps a backend and times every call to it as the "backend" stage.
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+
+        def timed(*args):
+            start = time.perf_counter()
+            result = method(*args)
+            self.metrics.add("backend", time.perf_counter() - start)
+            return result
+
+        # Saved on the wrapper so the function is only made once per method.
+        setattr(self, name, timed)
+        return timed
@@ -0,0 +1,247 @@
+# Moves the OS calls off the input thread.
+# The input thread puts compiled actions into a bounded queue and a separate worker thread runs them,
+# so a slow backend call (or a delayed key) never holds up reading the controller.
+
+import heapq
+import itertools
+import threading
+import time
+
+import logger
+
+# What to do when the queue is full:
+#   block: the input thread waits for room (backpressure), for at most block_timeout seconds
+#   drop_newest: the new action is thrown away
+#   drop_oldest: the oldest waiting action is thrown away to make room
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+log = logger.get_logger("output")
+
+
+class ActionQueue:
+    # Bounded ring buffer with a single producer (the input thread) and a single consumer (the worker).
+    # Only the producer moves the tail and, apart from drop_oldest, only the consumer moves the head,
+    # so putting an action doesn't need a lock. The lock only guards the head.
+
+    def __init__(self, capacity=256, policy="drop_oldest", coalesce=False, block_timeout=0.05):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Overflow policy must be one of {OVERFLOW_POLICIES}, got {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        # With coalesce, an action that's the same as the last one still waiting in the queue is skipped.
+        self.coalesce = coalesce
+        self.block_timeout = block_timeout
+
+        self.actions = [None] * capacity
+        self.delays = [0.0] * capacity
+        self.head = 0
+        self.tail = 0
+        self.head_lock = threading.Lock()
+        self.has_items = threading.Event()
+        self.has_room = threading.Event()
+        self.closed = False  # set by close(), wait() then returns right away
+
+        self.put_count = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def put(self, action, delay=0.0):
+        # Returns False if an action was lost: this one didn't fit, or the oldest was dropped to make room for it.
+        depth = self.tail - self.head
+        if self.coalesce and depth and self.actions[(self.tail - 1) % self.capacity] is action:
+            self.coalesced += 1
+            return True
+
+        evicted = False
+        if depth >= self.capacity:
+            dropped = self.dropped
+            if not self.make_room():
+                self.dropped += 1
+                return False
+            evicted = self.dropped != dropped
+
+        index = self.tail % self.capacity
+        self.actions[index] = action
+        self.delays[index] = delay
+        self.tail += 1
+        self.put_count += 1
+
+        depth = self.tail - self.head
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self.has_items.set()
+        return not evicted
+
+    def make_room(self):
+        # Called when the queue is full, returns True once there's room for another action.
+        if self.policy == "drop_newest":
+            return False
+
+        if self.policy == "drop_oldest":
+            with self.head_lock:
+                if self.tail - self.head >= self.capacity:
+                    self.actions[self.head % self.capacity] = None
+                    self.head += 1
+                    self.dropped += 1
+            return True
+
+        start = time.perf_counter()
+        deadline = start + self.block_timeout
+        while self.tail - self.head >= self.capacity:
+            self.has_room.clear()
+            if self.tail - self.head < self.capacity:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self.has_room.wait(remaining):
+                break
+        self.blocked_time += time.perf_counter() - start
+        return self.tail - self.head < self.capacity
+
+    def get(self):
+        # Returns the oldest (action, delay), or None if the queue is empty.
+        with self.head_lock:
+            if self.head == self.tail:
+                return None
+            index = self.head % self.capacity
+            item = self.actions[index], self.delays[index]
+            self.actions[index] = None
+            self.head += 1
+        self.has_room.set()
+        return item
+
+    def wait(self, timeout=None):
+        # Waits until there's something in the queue, returns False if the timeout ran out first
+        # or the queue was closed.
+        while self.head == self.tail:
+            if self.closed:
+                return False
+            self.has_items.clear()
+            if self.head != self.tail or self.closed:
+                break
+            if not self.has_items.wait(timeout):
+                return False
+        return True
+
+    def close(self):
+        # Wakes up whoever is waiting, for good.
+        self.closed = True
+        self.has_items.set()
+
+    def stats(self):
+        return {
+            "depth": self.tail - self.head,
+            "max_depth": self.max_depth,
+            "capacity": self.capacity,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "blocked_seconds": self.blocked_time
+        }
+
+
+class OutputWorker(threading.Thread):
+    # Runs the queued actions. Delayed actions are kept in a heap and run when they're due,
+    # instead of sleeping through them.
+    # It can run the actions of several queues, e.g. one per controller: every queue still has a single producer,
+    # and they take turns so a burst on one doesn't hold up the others. A closed queue is let go once it's empty.
+
+    def __init__(self, queue):
+        threading.Thread.__init__(self)
+        self.queue = queue  # the queue put() goes to
+        self.queues = []  # replaced, not changed, so the worker can go through it without the lock
+        self.queues_lock = threading.Lock()
+        self.has_items = threading.Event()  # set by every queue when an action is put
+        self.scheduled = []  # heap of (due time, order, action)
+        self.order = itertools.count()
+        self._is_running = True
+        self.daemon = True
+        self.errors = 0  # actions that raised
+        self.completed = 0  # actions that ran, including the ones that raised
+        self.add_queue(queue)
+
+    def put(self, action, delay=0.0):
+        return self.queue.put(action, delay)
+
+    def add_queue(self, queue):
+        queue.has_items = self.has_items
+        with self.queues_lock:
+            self.queues = self.queues + [queue]
+        self.has_items.set()
+
+    def remove_queue(self, queue):
+        with self.queues_lock:
+            self.queues = [other for other in self.queues if other is not queue]
+
+    def stop(self):
+        self._is_running = False
+        self.has_items.set()
+
+    def run_action(self, action):
+        # An action that fails (e.g. the OS refusing a key) is logged, it doesn't stop the worker.
+        try:
+            action()
+        except Exception as error:
+            self.errors += 1
+            log.error("action_failed", action=repr(action), error=repr(error))
+        self.completed += 1
+
+    def schedule_at(self, due, action):
+        # Runs an action at a time.monotonic() time. The heap isn't locked, so this may only be called
+        # from the worker's own thread, i.e. by an action that's running.
+        heapq.heappush(self.scheduled, (due, next(self.order), action))
+
+    def run_due(self):
+        # Runs the delayed actions that are due, returns how long until the next one (or None).
+        now = time.monotonic()
+        while self.scheduled and self.scheduled[0][0] <= now:
+            _, _, action = heapq.heappop(self.scheduled)
+            self.run_action(action)
+        if self.scheduled:
+            return self.scheduled[0][0] - now
+        return None
+
+    def has_work(self):
+        return any(len(queue) or queue.closed for queue in self.queues)
+
+    def wait(self, timeout=None):
+        # Waits until there's something in one of the queues, returns False if the timeout ran out first
+        # or the worker was stopped.
+        while not self.has_work():
+            if not self._is_running:
+                return False
+            self.has_items.clear()
+            if self.has_work() or not self._is_running:
+                break
+            if not self.has_items.wait(timeout):
+                return False
+        return True
+
+    def run_queued(self):
+        # Runs everything that's in the queues right now, one action of every queue at a time.
+        queues = self.queues
+        while queues:
+            busy = []
+            for queue in queues:
+                item = queue.get()
+                if item is None:
+                    if queue.closed:
+                        self.remove_queue(queue)
+                    continue
+                busy.append(queue)
+                action, delay = item
+                if delay > 0:
+                    self.schedule_at(time.monotonic() + delay, action)
+                else:
+                    self.run_action(action)
+            queues = busy
+
+    def run(self):
+        while self._is_running:
+            self.wait(self.run_due())
+            self.run_queued()
+            self.run_due()
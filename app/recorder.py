@@ -0,0 +1,191 @@
+# Records the controller keys that the engine receives into a file, and plays them back.
+# Keys are recorded with the values the controller sent, before a shard's axis filter changes them.
+# A recording can be replayed into an ActionGenerator through ReplayEventManager, which stands in for
+# pyjoystick's ThreadEventManager, either with the original timing or as fast as possible.
+
+# Usage (from the app folder):
+#   python recorder.py record session.rec
+#   python recorder.py replay session.rec [--fast] [--backend os|null|recording]
+
+# File format: a header, then one fixed-size record per key.
+#   time (float64, seconds since the recording started), device id (int32), key type (uint8),
+#   key number (uint8), value (float32)
+
+from pyjoystick import Key
+
+import struct
+import threading
+import time
+
+from devices import get_device_id
+
+HEADER = b"CFWREC1\n"
+RECORD = struct.Struct("<diBBf")
+
+# Key types are stored as numbers to keep records small.
+KEY_TYPES = [Key.AXIS, Key.BUTTON, Key.HAT, Key.BALL]
+KEY_TYPE_CODES = {keytype: code for code, keytype in enumerate(KEY_TYPES)}
+
+
+class InputRecorder:
+    # Writes keys to a recording file as they arrive.
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(HEADER)
+        self.start_time = time.perf_counter()
+        self.count = 0
+
+    def write(self, key):
+        record = RECORD.pack(
+            time.perf_counter() - self.start_time, get_device_id(key),
+            KEY_TYPE_CODES[key.keytype], key.number, key.value)
+        self.file.write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayJoystick:
+    # Stands in for a recorded controller, it only remembers the last value of every axis.
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+        self.axis = {}
+
+    def get_id(self):
+        return self.identifier
+
+    def get_axis(self, number):
+        return self.axis.get(number, 0)
+
+
+def load_recording(path):
+    # Returns a list of (time, key) from a recording file.
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(HEADER):
+        raise ValueError(f"{path} is not a controller recording")
+
+    joysticks = {}
+    events = []
+    for timestamp, device_id, keytype, number, value in RECORD.iter_unpack(data[len(HEADER):]):
+        if device_id not in joysticks:
+            joysticks[device_id] = ReplayJoystick(device_id)
+        key = Key(KEY_TYPES[keytype], number, value, joysticks[device_id])
+        events.append((timestamp, key))
+    return events
+
+
+class ReplayEventManager:
+    # Replays a recording through the same find_key() that ThreadEventManager has.
+    # With realtime=False every key is returned right away, for throughput tests.
+
+    def __init__(self, events, realtime=True):
+        self.events = events
+        self.realtime = realtime
+        self.joysticks = list({key.joystick.get_id(): key.joystick for _, key in events}.values())
+        self.position = 0
+        self.start_time = None
+        self.finished = threading.Event()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.stopped.set()
+
+    def find_key(self, timeout=float('inf')):
+        # Returns the next recorded key. Once the recording is over this blocks like the real manager would,
+        # until the manager is stopped or the timeout runs out.
+        if self.position >= len(self.events):
+            self.finished.set()
+            self.stopped.wait(None if timeout == float('inf') else timeout)
+            return None
+
+        timestamp, key = self.events[self.position]
+        self.position += 1
+
+        if self.realtime:
+            delay = self.start_time + timestamp - time.perf_counter()
+            if delay > 0 and self.stopped.wait(delay):
+                return None
+
+        if key.keytype == Key.AXIS:
+            key.joystick.axis[key.number] = key.value
+        return key
+
+
+def record(path):
+    # Records every key from the connected controllers until Ctrl+C is pressed.
+    from pyjoystick.sdl2 import run_event_loop
+    import pyjoystick
+
+    recorder = InputRecorder(path)
+    mngr = pyjoystick.ThreadEventManager(event_loop=run_event_loop)
+    mngr.start()
+    print(f"Recording to {path}, press Ctrl+C to stop")
+    try:
+        while True:
+            key = mngr.find_key(timeout=float('inf'))
+            if key:
+                recorder.write(key)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mngr.stop()
+        recorder.close()
+    print(f"Recorded {recorder.count} keys")
+
+
+def replay(path, realtime, backend_name):
+    # Replays a recording into the engine with the preset that's in use.
+    import backends
+    import mapping
+
+    backend_types = {
+        "os": backends.InputLibBackend,
+        "null": backends.NullBackend,
+        "recording": backends.RecordingBackend
+    }
+    backend = backend_types[backend_name]()
+
+    controls_dict = mapping.Controls().get()
+    keybinds_class = mapping.Keybinds()
+    keybinds = keybinds_class.return_match(mapping.Presets().get())[0]
+    keybinds_dict = keybinds_class.bind(controls_dict, keybinds)
+
+    events = load_recording(path)
+    mngr = ReplayEventManager(events, realtime=realtime)
+    action_generator = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=backend, event_manager=mngr)
+
+    start = time.perf_counter()
+    action_generator.start()
+    mngr.finished.wait()
+    elapsed = time.perf_counter() - start
+    action_generator.stop()
+
+    print(f"Replayed {len(events)} keys in {elapsed:.3f}s")
+    if backend_name == "recording":
+        print(f"{len(backend.actions)} actions were generated")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record and replay controller input")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("path")
+    replay_parser = commands.add_parser("replay")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--fast", action="store_true", help="ignore the recorded timing")
+    replay_parser.add_argument("--backend", choices=["os", "null", "recording"], default="null")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path)
+    else:
+        replay(args.path, realtime=not args.fast, backend_name=args.backend)
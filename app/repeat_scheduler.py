@@ -0,0 +1,163 @@
+# Repeats held buttons, sticks and the D-pad, replacing pyjoystick's Repeater.
+# pyjoystick's Repeater wakes up every check_timeout to look for keys that need repeating, even when nothing
+# is held. This one keeps the next repeat of every held key in a heap and sleeps until exactly that time,
+# so it doesn't wake up at all while nothing is held.
+# Every control can have its own delay and rate, and the rate can speed up the longer it's held.
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class RepeatSettings:
+    # delay: seconds before the first repeat, None turns repeating off for the key
+    # interval: seconds between repeats
+    # acceleration: every repeat, the interval is multiplied by this (below 1 speeds up)
+    # min_interval: the interval never goes below this
+
+    def __init__(self, delay, interval, acceleration=1.0, min_interval=None):
+        self.delay = delay
+        self.interval = interval
+        self.acceleration = acceleration
+        self.min_interval = interval if min_interval is None else min_interval
+
+    def next_interval(self, interval):
+        return max(self.min_interval, interval * self.acceleration)
+
+
+class RepeatScheduler:
+    # Can be given to pyjoystick's ThreadEventManager as its button_repeater, the manager sets key_repeated,
+    # calls set() for every key and start()/stop() with itself.
+
+    def __init__(self, delay, interval, enabled=True):
+        self.settings = RepeatSettings(delay, interval)
+        self.key_settings = {}  # raw key name (e.g. "-Axis 1") to RepeatSettings
+        self.enabled = enabled
+
+        self.held = {}  # key hash to [key, due time, interval, order]
+        self.deadlines = []  # heap of (due time, order, key hash)
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.generation = 0  # changes everytime the thread is started or stopped
+
+    def key_repeated(self, key):
+        # Replaced by the event manager.
+        pass
+
+    def configure(self, delay, interval, enabled=True):
+        # Changes the repeat timing of every key that doesn't have its own settings.
+        with self.condition:
+            self.settings = RepeatSettings(delay, interval)
+            self.enabled = enabled
+            if not enabled:
+                self.held.clear()
+                self.deadlines.clear()
+            self.condition.notify_all()
+
+    def set_key_settings(self, keyname, settings):
+        # Gives one key its own repeat timing, None goes back to the default.
+        with self.condition:
+            if settings is None:
+                self.key_settings.pop(keyname, None)
+            else:
+                self.key_settings[keyname] = settings
+
+    @staticmethod
+    def get_key_hash(key):
+        # Same as pyjoystick, both sides of a stick share a hash so that only one can repeat at a time.
+        if key.joystick:
+            return f"{key.joystick}:{key.keytype} {key.number}"
+        return f"{key.keytype} {key.number}"
+
+    def set(self, key):
+        # Starts repeating a key when it's pressed, stops when it's released.
+        if key.value:
+            self.start_repeat(key)
+        else:
+            self.stop_repeat(key)
+
+    def start_repeat(self, key):
+        if not self.enabled:
+            return
+        settings = self.key_settings.get(str(key), self.settings)
+        if settings.delay is None:
+            return
+
+        key_hash = self.get_key_hash(key)
+        with self.condition:
+            held = self.held.get(key_hash)
+            if held is not None and held[0].value == key.value:
+                # Already repeating
+                return
+
+            due = time.monotonic() + settings.delay
+            order = next(self.order)
+            self.held[key_hash] = [key, due, settings.interval, order]
+            heapq.heappush(self.deadlines, (due, order, key_hash))
+            if self.deadlines[0][1] == order:
+                # It's now the first key to repeat, so the thread has to wake up earlier than it planned to.
+                self.condition.notify()
+
+    def stop_repeat(self, key):
+        # The key's deadline stays in the heap, it's skipped once it comes up since the key isn't held anymore.
+        with self.condition:
+            self.held.pop(self.get_key_hash(key), None)
+
+    def pop_due(self):
+        # Returns the keys that are due for a repeat and schedules their next one.
+        now = time.monotonic()
+        due_keys = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, order, key_hash = heapq.heappop(self.deadlines)
+            held = self.held.get(key_hash)
+            if held is None or held[3] != order:
+                # Released, or pressed again since this deadline was made
+                continue
+
+            key, due, interval, _ = held
+            new_key = key.copy()
+            new_key.is_repeat = True
+            due_keys.append(new_key)
+
+            settings = self.key_settings.get(str(key), self.settings)
+            order = next(self.order)
+            # Scheduled from the deadline rather than from now, so repeats don't drift.
+            due = max(due + interval, now)
+            held[1:] = [due, settings.next_interval(interval), order]
+            heapq.heappush(self.deadlines, (due, order, key_hash))
+        return due_keys
+
+    def run(self, generation):
+        while True:
+            with self.condition:
+                while self.generation == generation:
+                    if not self.deadlines:
+                        self.condition.wait()
+                        continue
+                    timeout = self.deadlines[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+                if self.generation != generation:
+                    return
+                due_keys = self.pop_due()
+
+            for key in due_keys:
+                self.key_repeated(key)
+
+    def start(self):
+        with self.condition:
+            self.generation += 1
+            generation = self.generation
+        self.thread = threading.Thread(target=self.run, args=(generation,), name="RepeatScheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.generation += 1
+            self.held.clear()
+            self.deadlines.clear()
+            self.condition.notify_all()
+        self.thread = None
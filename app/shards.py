@@ -0,0 +1,229 @@
+# Runs one engine (shard) per connected controller.
+# A single pyjoystick event manager reads every controller, and its keys are routed by the controller's
+# instance id to that controller's own ActionGenerator. Every shard has its own preset, control definitions,
+# repeat scheduler and input thread, so a burst of input on one controller doesn't hold up the others.
+# All shards share the same output backend and the same OutputThreads (output worker and cursors), so
+# there's one cursor position however many controllers move it.
+# Every shard puts its actions into a queue of its own, which the one output worker takes turns on.
+
+from pyjoystick.sdl2 import run_event_loop
+
+import pyjoystick
+import queue
+import threading
+import backends
+import devices
+import mapping
+from devices import get_device_id
+
+
+class DeviceEventSource:
+    # Stands in for the event manager of a single shard. The ShardedEngine puts every key of the controller
+    # in here, and the shard takes them out with find_key() just like it would from pyjoystick's manager.
+
+    def __init__(self, joystick=None):
+        self.keys = queue.SimpleQueue()
+        self.joysticks = [joystick] if joystick is not None else []
+        self.button_repeater = None
+        self.axis_filter = None  # the shard's axis_filters.AxisFilter
+        self.recorder = None  # set through the shard's recorder, gets the keys before they're filtered
+
+    def start(self):
+        if self.button_repeater is not None:
+            self.button_repeater.start()
+
+    def stop(self):
+        if self.button_repeater is not None:
+            self.button_repeater.stop()
+        self.keys.put(None)
+
+    def put(self, key):
+        # Every key of the controller goes through here, including releases, so repeats can start and stop.
+        # Axis keys go through the axis filter first, which drops the ones that are only the stick wobbling.
+        if self.recorder is not None:
+            self.recorder.write(key)
+        if self.axis_filter is not None:
+            key = self.axis_filter.filter_key(key)
+            if key is None:
+                return
+        if self.button_repeater is not None:
+            self.button_repeater.set(key)
+        self.put_key(key)
+
+    def put_key(self, key):
+        # Only pressed keys are handed to the shard, the same as pyjoystick's find_key().
+        if abs(key.value) > 0.5:
+            self.keys.put(key)
+
+    def find_key(self, timeout=float('inf')):
+        try:
+            return self.keys.get(timeout=None if timeout == float('inf') else timeout)
+        except queue.Empty:
+            return None
+
+
+class ShardedEngine:
+    # Has the same methods the app uses on an ActionGenerator, and applies them to every shard.
+    # Controllers use the default keybinds/controls unless configure_device() gave them their own.
+
+    def __init__(self, keybinds_dict, controls_dict, backend=None, activity_timeout=1/30, tuning_values=None):
+        if backend is None:
+            backend = backends.InputLibBackend()
+        self.backend = backend
+        self.controls = controls_dict
+        self._keybinds = keybinds_dict
+        self.chord_binds = []
+        self.enabled = True
+        self.activity_timeout = activity_timeout  # how often pyjoystick's manager hands out its events
+
+        self.device_configs = {}  # device id to (keybinds, controls, chord binds)
+        self.axis_settings = {}  # axis number to axis_filters.AxisSettings
+        self.shards = {}  # device id to ActionGenerator
+        self.devices = devices.DeviceRegistry()  # the controllers that are plugged in
+        self.lock = threading.Lock()
+        self.mngr = None
+        self.tuning_values = None  # given tuning, None reads it from the database
+        self.macro_steps = None  # given macros, None reads them from the database
+        self.get_tuning_data(tuning_values)
+        self.output_threads = mapping.OutputThreads(backend, self.cursor_rate)
+
+    @property
+    def keybinds(self):
+        return self._keybinds
+
+    @keybinds.setter
+    def keybinds(self, keybinds_dict):
+        # Sets the default keybinds, controllers with their own preset keep it.
+        self._keybinds = keybinds_dict
+        with self.lock:
+            for device_id, shard in self.shards.items():
+                if device_id not in self.device_configs:
+                    shard.keybinds = keybinds_dict
+
+    def enable(self):
+        self.enabled = True
+        for shard in list(self.shards.values()):
+            shard.enable()
+
+    def disable(self):
+        self.enabled = False
+        for shard in list(self.shards.values()):
+            shard.disable()
+
+    def set_chords(self, chord_binds):
+        # Sets the default chords and combos, like keybinds they're kept by controllers with their own preset.
+        self.chord_binds = list(chord_binds)
+        with self.lock:
+            for device_id, shard in self.shards.items():
+                if device_id not in self.device_configs:
+                    shard.set_chords(self.chord_binds)
+
+    def configure_device(self, device_id, keybinds_dict, controls_dict=None, chord_binds=()):
+        # Gives a controller its own keybinds and, for controllers with a different layout, its own controls.
+        # Passing None as keybinds_dict makes it use the default keybinds again.
+        with self.lock:
+            if keybinds_dict is None:
+                self.device_configs.pop(device_id, None)
+                keybinds_dict, controls_dict, chord_binds = self._keybinds, self.controls, self.chord_binds
+            else:
+                if controls_dict is None:
+                    controls_dict = self.controls
+                self.device_configs[device_id] = (keybinds_dict, controls_dict, list(chord_binds))
+
+            shard = self.shards.get(device_id)
+            if shard is not None:
+                shard.controls = controls_dict
+                shard.chord_binds = list(chord_binds)
+                shard.keybinds = keybinds_dict
+
+    def get_tuning_data(self, tuning_values=None):
+        # Like ActionGenerator.get_tuning_data(), the tuning that's given is kept for controllers plugged in later.
+        self.tuning_values = tuning_values
+        if tuning_values is None:
+            tuning_values = mapping.db_cmds.get_all_data("tuning")[0]
+        self.cursor_mode = tuning_values[5]
+        self.cursor_rate = tuning_values[6]
+        for shard in list(self.shards.values()):
+            shard.get_tuning_data(self.tuning_values)
+
+    def update_event_repeater(self):
+        for shard in list(self.shards.values()):
+            shard.update_event_repeater()
+
+    def set_axis_settings(self, number, settings):
+        self.axis_settings[number] = settings
+        for shard in list(self.shards.values()):
+            shard.set_axis_settings(number, settings)
+
+    def update_macros(self, macro_steps=None):
+        self.macro_steps = macro_steps
+        for shard in list(self.shards.values()):
+            shard.update_macros(macro_steps)
+
+    def update_cursor(self):
+        self.output_threads.cursor.set_rate(self.cursor_rate)
+        self.output_threads.virtual_cursor.set_rate(self.cursor_rate)
+        for shard in list(self.shards.values()):
+            shard.update_cursor()
+
+    def get_shard(self, device_id, joystick=None):
+        # Returns the shard of a controller, starting a new one if it doesn't have one yet.
+        with self.lock:
+            shard = self.shards.get(device_id)
+            if shard is not None:
+                return shard
+
+            keybinds_dict, controls_dict, chord_binds = self.device_configs.get(
+                device_id, (self._keybinds, self.controls, self.chord_binds))
+            source = DeviceEventSource(joystick)
+            shard = mapping.ActionGenerator(keybinds_dict, controls_dict, backend=self.backend, event_manager=source,
+                                            tuning_values=self.tuning_values, macro_steps=self.macro_steps,
+                                            output_threads=self.output_threads)
+            shard.set_chords(chord_binds)
+            if not self.enabled:
+                shard.disable()
+            for number, settings in self.axis_settings.items():
+                shard.set_axis_settings(number, settings)
+            # The shard's own repeat scheduler repeats the keys straight back into its source.
+            source.button_repeater = shard.repeater
+            source.axis_filter = shard.axis_filter
+            shard.repeater.key_repeated = source.put_key
+            shard.name = f"ActionGenerator-{device_id}"
+            shard.start()
+            self.shards[device_id] = shard
+            return shard
+
+    def add_device(self, joystick):
+        self.devices.add(joystick)
+        self.get_shard(joystick.get_id(), joystick)
+
+    def remove_device(self, joystick):
+        self.devices.remove(joystick)
+        with self.lock:
+            shard = self.shards.pop(joystick.get_id(), None)
+        if shard is not None:
+            shard.stop()
+
+    def route_key(self, key):
+        device_id = get_device_id(key)
+        shard = self.shards.get(device_id)
+        if shard is None:
+            shard = self.get_shard(device_id, key.joystick)
+        shard.mngr.put(key)
+
+    def start(self):
+        self.output_threads.start()
+        self.mngr = pyjoystick.ThreadEventManager(
+            event_loop=run_event_loop, add_joystick=self.add_device, remove_joystick=self.remove_device,
+            handle_key_event=self.route_key, activity_timeout=self.activity_timeout)
+        self.mngr.start()
+
+    def stop(self):
+        if self.mngr is not None:
+            self.mngr.stop()
+        with self.lock:
+            shards = list(self.shards.values())
+            self.shards = {}
+        for shard in shards:
+            shard.stop()
+        self.output_threads.stop()
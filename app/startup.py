@@ -0,0 +1,44 @@
+# Measures how long each phase of startup takes (imports, engine, database, window...).
+# Import this before anything else, its clock starts when it's imported.
+# Run the app with --profile-startup to have the phases printed, they're always logged.
+
+import time
+
+import logger
+
+START_TIME = time.perf_counter()
+
+log = logger.get_logger("startup")
+
+
+class StartupProfiler:
+    def __init__(self, start_time=START_TIME):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.phases = []  # (name, seconds)
+
+    def mark(self, name):
+        # Ends a phase, it's the time since the last phase ended.
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last_time))
+        self.last_time = now
+
+    def get_elapsed(self, phase=None):
+        # Seconds from the start up to the end of a phase, or of the last phase.
+        elapsed = 0.0
+        for name, seconds in self.phases:
+            elapsed += seconds
+            if name == phase:
+                break
+        return elapsed
+
+    def format(self):
+        lines = [f"{name:>10}: {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        lines.append(f"{'total':>10}: {self.get_elapsed() * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def report(self, print_report=False):
+        log.info("startup", total_ms=round(self.get_elapsed() * 1000, 1),
+                 **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.phases})
+        if print_report:
+            print(self.format())
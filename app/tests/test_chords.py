@@ -0,0 +1,50 @@
+# Run from the app folder with: python -m unittest discover tests
+
+import unittest
+
+import chords
+
+
+class ChordMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.fired = []
+        singles = {name: self.action(name) for name in ("A", "B", "C", "X")}
+        self.matcher = chords.ChordMatcher(singles)
+        self.matcher.add(["A", "B"], self.action("A>B"), is_chord=False)
+        self.matcher.add(["A", "B", "C"], self.action("A>B>C"), is_chord=False)
+
+    def action(self, name):
+        return lambda: self.fired.append(name)
+
+    def test_longer_combo(self):
+        for keyname in ("A", "B", "C"):
+            self.matcher.press(keyname)
+        self.assertEqual(self.fired, ["A>B>C"])
+
+    def test_shorter_combo_fires_before_unrelated_key(self):
+        for keyname in ("A", "B", "X"):
+            self.matcher.press(keyname)
+        self.assertEqual(self.fired, ["A>B", "X"])
+        self.assertFalse(self.matcher.pending)
+
+    def test_shorter_combo_fires_when_time_runs_out(self):
+        self.matcher.press("A")
+        self.matcher.press("B")
+        self.matcher.expire()
+        self.assertEqual(self.fired, ["A>B"])
+
+    def test_unrelated_key_fires_held_back_keys(self):
+        self.matcher.press("A")
+        self.matcher.press("X")
+        self.assertEqual(self.fired, ["A", "X"])
+
+    def test_repeats_of_held_key_fire_every_time(self):
+        self.matcher.press("A")
+        for _ in range(5):
+            self.matcher.press("A", is_repeat=True)
+        self.assertEqual(self.fired, ["A"] * 6)
+        self.assertFalse(self.matcher.pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+# Run from the app folder with: python -m unittest discover tests
+
+import threading
+import time
+import unittest
+
+import cursor
+
+
+class VirtualCursorTest(unittest.TestCase):
+    def test_moves_reach_the_os_in_order(self):
+        sent = []
+
+        def move_to(x, y):
+            time.sleep(0)  # lets the other threads run, as a slow OS call would
+            sent.append((x, y))
+
+        virtual_cursor = cursor.VirtualCursor(
+            get_position=lambda: (0, 0), move_to=move_to, get_bounds=lambda: (0, 0, 100000, 0))
+        threads = [threading.Thread(target=lambda: [virtual_cursor.move_by(1, 0) for _ in range(500)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sent, [(x, 0) for x in range(1, 2001)])
+
+
+if __name__ == "__main__":
+    unittest.main()
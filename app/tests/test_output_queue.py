@@ -0,0 +1,63 @@
+# Run from the app folder with: python -m unittest discover tests
+
+import threading
+import unittest
+
+import output_queue
+
+
+class OutputWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.worker = output_queue.OutputWorker(output_queue.ActionQueue())
+        self.ran = []
+
+    def tearDown(self):
+        self.worker.stop()
+        if self.worker.is_alive():
+            self.worker.join(1)
+
+    def action(self, name):
+        return lambda: self.ran.append(name)
+
+    def test_queues_take_turns(self):
+        first = output_queue.ActionQueue()
+        second = output_queue.ActionQueue()
+        self.worker.add_queue(first)
+        self.worker.add_queue(second)
+        for number in range(3):
+            first.put(self.action(f"first {number}"))
+        second.put(self.action("second 0"))
+        self.worker.run_queued()
+        self.assertEqual(self.ran, ["first 0", "second 0", "first 1", "first 2"])
+
+    def test_burst_only_drops_from_its_own_queue(self):
+        burst = output_queue.ActionQueue(capacity=4, policy="drop_oldest")
+        other = output_queue.ActionQueue(capacity=4, policy="drop_oldest")
+        self.worker.add_queue(burst)
+        self.worker.add_queue(other)
+        other.put(self.action("other"))
+        for number in range(10):
+            burst.put(self.action(number))
+        self.worker.run_queued()
+        self.assertIn("other", self.ran)
+        self.assertEqual(burst.dropped, 6)
+        self.assertEqual(other.dropped, 0)
+
+    def test_closed_queue_is_run_then_let_go(self):
+        queue = output_queue.ActionQueue()
+        self.worker.add_queue(queue)
+        done = threading.Event()
+        queue.put(self.action("last"))
+        queue.put(done.set)
+        queue.close()
+        self.worker.start()
+        self.assertTrue(done.wait(1))
+        self.assertEqual(self.ran, ["last"])
+        self.worker.stop()
+        self.worker.join(1)
+        self.assertNotIn(queue, self.worker.queues)
+        self.assertFalse(self.worker.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()